@@ -1,25 +1,184 @@
 import streamlit as st
 import os
+import sys
+import time
+import hashlib
 from dotenv import load_dotenv
 load_dotenv()
 
 if "GOOGLE_API_KEY" in st.secrets:
     os.environ["GOOGLE_API_KEY"] = st.secrets["GOOGLE_API_KEY"]
-import pandas as pd
-from src.graph import app_graph
-from src.tools import FileTools
+from src.graph import stream_case
+from src.tools import FileTools, PAGE_BREAK
 from src.assets import ICONS, CSS_STYLES
-from src.utils import ensure_directories_exist
+from src.utils import ensure_directories_exist, setup_logging
+from src.telemetry import metrics, start_exporters
+from src.classifier import intent_classifier
+from src.history import case_history
 from dotenv import load_dotenv
 
 
 #  Configuration
 load_dotenv()
+setup_logging()
 ensure_directories_exist()
+start_exporters()
 st.set_page_config(page_title="CRIS Enterprise", page_icon="🩺", layout="wide")
 st.markdown(CSS_STYLES, unsafe_allow_html=True)
 
 
+@st.cache_resource(max_entries=16, show_spinner=False)
+def prepare_upload(content_hash, file_type, _uploaded_file):
+    """
+    Parses an upload once per unique file content; reruns and other sessions reuse the result.
+    Held as a shared resource rather than pickled per rerun, since PDFs carry encoded page images.
+    """
+    if file_type == 'application/pdf':
+        return FileTools.extract_pdf(_uploaded_file)
+    return FileTools.process_image(_uploaded_file)
+
+
+def render_medicine(data):
+    if "name" in data:
+        st.markdown(f"""
+        <div style="display: flex; align-items: center; gap: 12px; margin-bottom: 25px; padding-bottom: 15px; border-bottom: 1px solid #e2e8f0;">
+            {ICONS['medicine']}
+            <div>
+                <h2 style="margin:0; font-size: 1.4rem;">{data.get('name')}</h2>
+                <span style="color: #64748b; font-size: 0.9rem;">Brands: {data.get('brand_names', 'Generic')}</span>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    c1, c2 = st.columns([1.2, 1])
+
+    with c1:
+        if "uses" in data:
+            st.markdown(f"<div class='section-header'>{ICONS['clipboard']} Indications</div>", unsafe_allow_html=True)
+            for use in data.get('uses', []):
+                st.markdown(f"• {use}")
+
+        if "dosage" in data:
+            st.markdown(f"<div class='section-header' style='margin-top: 20px;'>{ICONS['chart']} Dosage & Administration</div>", unsafe_allow_html=True)
+            st.info(data.get('dosage', 'Refer to package insert.'))
+
+        if "side_effects" in data:
+            st.markdown(f"<div class='section-header' style='margin-top: 20px;'>{ICONS['warning']} Adverse Effects</div>", unsafe_allow_html=True)
+            st.write(", ".join(data.get('side_effects', [])))
+
+    with c2:
+        if "mechanism" in data:
+            st.markdown(f"<div class='section-header'>{ICONS['mechanism']} Mechanism of Action</div>", unsafe_allow_html=True)
+            st.markdown(f"""
+            <div style="background-color: #eff6ff; border: 1px solid #dbeafe; border-radius: 8px; padding: 16px; color: #1e40af; font-size: 0.95rem; line-height: 1.5;">
+                {data.get('mechanism')}
+            </div>
+            """, unsafe_allow_html=True)
+
+        if "lifestyle_diet" in data:
+            st.markdown(f"<div class='section-header' style='margin-top: 20px;'>{ICONS['check']} Lifestyle & Diet</div>", unsafe_allow_html=True)
+            st.markdown(f"""
+            <div style="background-color: #f0fdf4; border: 1px solid #bbf7d0; border-radius: 8px; padding: 16px; color: #166534; font-size: 0.95rem;">
+                {data.get('lifestyle_diet', 'No specific restrictions.')}
+            </div>
+            """, unsafe_allow_html=True)
+
+    if "warnings" in data:
+        st.markdown("---")
+        st.markdown(f"""
+        <div style="background: #fef2f2; border: 1px solid #fecaca; border-radius: 8px; padding: 16px; display: flex; gap: 12px;">
+            {ICONS['warning']}
+            <div>
+                <strong style="color: #991b1b; font-size: 1rem;">Black Box Warning / Contraindications</strong>
+                <p style="margin: 4px 0 0 0; color: #7f1d1d; font-size: 0.9rem;">{data.get('warnings')}</p>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+
+
+def render_diagnosis(data):
+    if "title" in data or "condition" in data:
+        title = data.get('title', data.get('condition', 'Clinical Assessment'))
+        severity_color = "#22c55e" if data.get('severity') == 'Low' else "#eab308" if data.get('severity') == 'Moderate' else "#ef4444"
+
+        st.markdown(f"""
+        <div style="display: flex; align-items: center; gap: 12px; margin-bottom: 20px; padding-bottom: 15px; border-bottom: 1px solid #e2e8f0;">
+            {ICONS['radiology']}
+            <h2 style="margin:0; font-size: 1.4rem;">{title}</h2>
+            <span style="background:{severity_color}20; color:{severity_color}; padding:4px 12px; border-radius:99px; font-weight:600; font-size:0.8rem; margin-left:auto; border: 1px solid {severity_color}40;">
+                {data.get('severity', 'Standard').upper()} ACUITY
+            </span>
+        </div>
+        """, unsafe_allow_html=True)
+
+    if "summary" in data or "description" in data:
+        st.markdown(f"""
+        <div style="background-color: #f8fafc; border-left: 4px solid #3b82f6; padding: 16px; border-radius: 0 8px 8px 0; margin-bottom: 20px;">
+            <strong style="color: #334155; display: block; margin-bottom: 4px;">Executive Summary</strong>
+            <span style="color: #475569;">{data.get('summary', data.get('description'))}</span>
+        </div>
+        """, unsafe_allow_html=True)
+
+    col_a, col_b = st.columns(2)
+
+    with col_a:
+        if data.get('findings'):
+            st.markdown(f"<div class='section-header'>{ICONS['search']} Key Clinical Findings</div>", unsafe_allow_html=True)
+            for f in data['findings']: st.markdown(f"• {f}")
+
+    with col_b:
+        if data.get('interpretation'):
+            st.markdown(f"<div class='section-header'>{ICONS['brain']} Clinical Interpretation</div>", unsafe_allow_html=True)
+            st.info(data.get('interpretation'))
+
+    if data.get('table_data'):
+        import pandas as pd  # only needed for the lab table
+        st.markdown(f"<div class='section-header'>{ICONS['chart']} Quantitative Analysis</div>", unsafe_allow_html=True)
+        st.dataframe(pd.DataFrame(data['table_data']), hide_index=True, use_container_width=True)
+
+    if "recommendations" in data:
+        st.markdown(f"<div class='section-header' style='margin-top: 15px;'>{ICONS['check']} Recommended Management Protocol</div>", unsafe_allow_html=True)
+        for rec in data.get('recommendations', []):
+            st.markdown(f"""
+            <div style="background: white; border: 1px solid #e2e8f0; border-left: 4px solid #10b981; padding: 12px; margin-bottom: 8px; border-radius: 4px; box-shadow: 0 1px 2px rgba(0,0,0,0.05);">
+                {rec}
+            </div>
+            """, unsafe_allow_html=True)
+
+    if data.get('lifestyle'):
+        st.markdown(f"<div class='section-header' style='margin-top: 15px;'>{ICONS['medicine']} Lifestyle Modification</div>", unsafe_allow_html=True)
+        st.info(data.get('lifestyle'))
+
+
+def render_test_info(data):
+    if "test_name" in data:
+        st.markdown(f"""
+        <div style="display: flex; align-items: center; gap: 12px; margin-bottom: 20px;">
+            {ICONS['procedure']}
+            <h2 style="margin:0; font-size: 1.4rem;">Procedure Guide: {data.get('test_name')}</h2>
+        </div>
+        """, unsafe_allow_html=True)
+    if "purpose" in data:
+        st.info(f"**Clinical Indication:** {data.get('purpose')}")
+    t1, t2, t3 = st.tabs(["Step-by-Step Protocol", "Patient Preparation", "Reference Ranges"])
+    with t1:
+        if "procedure" in data: st.markdown(data.get('procedure'))
+    with t2:
+        if "preparation" in data: st.markdown(data.get('preparation'))
+    with t3:
+        if "normal_range" in data: st.markdown(f"**Normal Limits:** {data.get('normal_range')}")
+
+
+def render_result(intent, data):
+    """Renders a (possibly partial, mid-stream) structured response; sections appear as their fields arrive."""
+    if intent == "medicine_info":
+        render_medicine(data)
+    elif intent == "diagnosis":
+        render_diagnosis(data)
+    elif intent == "test_info":
+        render_test_info(data)
+
+
 with st.sidebar:
     st.markdown(f"""
     <div style="display: flex; align-items: center; gap: 12px; margin-bottom: 20px;">
@@ -44,9 +203,44 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
     st.markdown("---")
+    with st.expander("Case History"):
+        history_query = st.text_input("Search past cases", placeholder="e.g. metformin, chest pain")
+        past_cases = case_history.search(history_query, limit=10)
+        if not past_cases:
+            st.caption("No saved cases found.")
+        for case in past_cases:
+            label = f"{case['title']} · {time.strftime('%d %b %H:%M', time.localtime(case['created']))}"
+            if st.button(label, key=f"case-{case['id']}", use_container_width=True):
+                # Replays the stored answer; no model call.
+                stored = case_history.get(case['id'])
+                if stored:
+                    st.session_state.result = stored['structured_response']
+                    st.session_state.intent = stored['intent']
+                    st.session_state.timing = {"replayed": stored['created']}
     with st.expander("Administration"):
         st.caption("Data Source: Internal Knowledge Graph")
         st.caption("Compliance: HIPAA / GDPR Ready")
+        st.markdown("**Performance**")
+        spans = metrics.span_summary()
+        if spans:
+            st.dataframe(spans, hide_index=True, use_container_width=True)
+        else:
+            st.caption("No requests recorded yet.")
+        tokens = {"prompt": 0, "response": 0}
+        for labels, value in metrics.counter_totals("cris_llm_tokens_total").items():
+            tokens[dict(labels)["kind"]] += value
+        cache_hits = sum(metrics.counter_totals("cris_cache_hits_total").values())
+        router = intent_classifier.stats()
+        st.caption(f"Tokens: {tokens['prompt']:,} prompt / {tokens['response']:,} response")
+        st.caption(f"Cache hits: {cache_hits:,} · Local routing: {router['hit_rate']:.0%} of {router['local_hits'] + router['llm_fallbacks']}")
+        # The graph imports the semantic cache (and numpy) on its first lookup; don't pay for it here.
+        semantic_module = sys.modules.get("src.semantic_cache")
+        if semantic_module:
+            semantic = semantic_module.semantic_cache.stats()
+            st.caption(f"Semantic cache: {semantic['hit_rate']:.0%} hits of {semantic['hits'] + semantic['misses']} · "
+                       f"{semantic['avg_lookup_ms']:.2f} ms/lookup · {semantic['entries']:,} entries")
+        st.download_button("Export metrics (Prometheus)", metrics.render_prometheus(),
+                           file_name="cris_metrics.prom", mime="text/plain", use_container_width=True)
 
 
 st.markdown(f"""
@@ -68,6 +262,7 @@ col1, col2 = st.columns([1, 2], gap="medium")
 # Session State
 if "result" not in st.session_state: st.session_state.result = None
 if "intent" not in st.session_state: st.session_state.intent = None
+if "timing" not in st.session_state: st.session_state.timing = None
 
 
 with col1:
@@ -88,159 +283,99 @@ with col1:
             user_input = st.text_area("Case Notes", height=250, 
                 placeholder="Patient ID: ---\nSymptoms:\n- \n\nQuery:")
         else:
-            uploaded_file = st.file_uploader("Upload Medical Record (PDF/Image)", type=['pdf', 'png', 'jpg'])
-            if uploaded_file:
+            uploaded_files = st.file_uploader("Upload Medical Record (PDF/Image)", type=['pdf', 'png', 'jpg'],
+                                              accept_multiple_files=True)
+            if uploaded_files:
                 input_type = "file"
-                if uploaded_file.type == 'application/pdf':
-                    user_input = FileTools.extract_text_from_pdf(uploaded_file)
-                    st.info("Document ready for analysis")
-                else:
-                    image_data = FileTools.process_image(uploaded_file)
-                    st.image(image_data, use_container_width=True)
+                prepared = [
+                    (f.type, prepare_upload(hashlib.sha256(f.getvalue()).hexdigest(), f.type, f))
+                    for f in uploaded_files
+                ]
+                documents = [p for file_type, p in prepared if file_type == 'application/pdf']
+                images = [p for file_type, p in prepared if file_type != 'application/pdf' and p is not None]
+                for document in documents:
+                    if document.error:
+                        st.error(document.error)
+                    if document.unread_pages:
+                        st.warning("⚠️ Could not read the scanned image on page(s) "
+                                   + ", ".join(map(str, document.unread_pages))
+                                   + "; these pages will not be analyzed.")
+                documents = [d for d in documents if not d.error]
+                # Scanned PDF pages arrive as encoded vision payloads and join the image list.
+                page_images = [payload for d in documents for payload in d.page_images]
+                if len(images) == 1 and not page_images:
+                    image_data = images[0]
+                elif images or page_images:
+                    # A series of images (and scanned pages) is analyzed as one case.
+                    image_data = page_images + images
+                if len(images) == 1:
+                    st.image(images[0], use_container_width=True)
+                elif images:
+                    st.caption(f"Imaging study: {len(images)} frames")
+                    st.image(images[:12], width=96)
+                if documents:
+                    user_input = ("\n" + PAGE_BREAK).join(d.text for d in documents if d.text.strip())
+                    st.info("Document ready for analysis" if len(documents) == 1 else f"{len(documents)} documents ready for analysis")
+                    if page_images:
+                        st.caption(f"{len(page_images)} scanned page image(s) will be read by the vision model")
 
         if st.button("Run Clinical Analysis", use_container_width=True):
             if not os.getenv("GOOGLE_API_KEY"):
                 st.error("System Error: API Key Missing.")
             elif input_mode == "Clinical Notes" and not user_input.strip():
                 st.warning("⚠️ Please enter clinical notes or a query before running analysis.")
-            elif input_mode == "Radiology / Labs" and not uploaded_file:
+            elif input_mode == "Radiology / Labs" and not uploaded_files:
                 st.warning("⚠️ Please upload a medical image or PDF document.")
+            elif input_mode == "Radiology / Labs" and not (user_input.strip() or image_data):
+                st.warning("⚠️ Nothing readable was found in the uploaded files.")
             else:
+                with col2:
+                    live = st.empty()
                 with st.spinner("Processing Clinical Data..."):
                     try:
                         inputs = {"user_input": user_input, "input_type": input_type, "image_data": image_data}
-                        response = app_graph.invoke(inputs)
-                        st.session_state.result = response['structured_response']
-                        st.session_state.intent = response['intent']
+                        started = time.perf_counter()
+                        first_content = None
+                        intent, partial, compaction = None, {}, None
+                        for kind, value in stream_case(inputs):
+                            if kind == "intent":
+                                intent = value
+                            elif kind == "field":
+                                if first_content is None:
+                                    first_content = time.perf_counter() - started
+                                partial[value[0]] = value[1]
+                                with live.container(border=True):
+                                    render_result(intent, partial)
+                            else:
+                                st.session_state.result = value['structured_response']
+                                st.session_state.intent = value['intent']
+                                compaction = value.get('compaction')
+                                case_history.record(value, value['structured_response'])
+                        total = time.perf_counter() - started
+                        # Cached answers arrive whole, so first content is the complete result.
+                        first_content = total if first_content is None else first_content
+                        st.session_state.timing = {"ttfc": first_content, "total": total, "compaction": compaction}
+                        metrics.observe("cris_time_to_first_content_seconds", first_content)
+                        metrics.observe("cris_time_to_result_seconds", total)
                     except Exception as e:
                         st.error(f"Analysis Failed: {str(e)}")
+                    finally:
+                        live.empty()
 
 
 with col2:
     if st.session_state.result:
-        data = st.session_state.result
-        intent = st.session_state.intent
-        
         with st.container(border=True):
-            
-            
-            if intent == "medicine_info":
-                # Header
-                st.markdown(f"""
-                <div style="display: flex; align-items: center; gap: 12px; margin-bottom: 25px; padding-bottom: 15px; border-bottom: 1px solid #e2e8f0;">
-                    {ICONS['medicine']}
-                    <div>
-                        <h2 style="margin:0; font-size: 1.4rem;">{data.get('name')}</h2>
-                        <span style="color: #64748b; font-size: 0.9rem;">Brands: {data.get('brand_names', 'Generic')}</span>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                c1, c2 = st.columns([1.2, 1])
-                
-                with c1:
-                    st.markdown(f"<div class='section-header'>{ICONS['clipboard']} Indications</div>", unsafe_allow_html=True)
-                    for use in data.get('uses', []): 
-                        st.markdown(f"• {use}")
-                    
-                    
-                    st.markdown(f"<div class='section-header' style='margin-top: 20px;'>{ICONS['chart']} Dosage & Administration</div>", unsafe_allow_html=True)
-                    st.info(data.get('dosage', 'Refer to package insert.'))
-
-                    st.markdown(f"<div class='section-header' style='margin-top: 20px;'>{ICONS['warning']} Adverse Effects</div>", unsafe_allow_html=True)
-                    st.write(", ".join(data.get('side_effects', [])))
-
-                with c2:
-                    st.markdown(f"<div class='section-header'>{ICONS['mechanism']} Mechanism of Action</div>", unsafe_allow_html=True)
-                    st.markdown(f"""
-                    <div style="background-color: #eff6ff; border: 1px solid #dbeafe; border-radius: 8px; padding: 16px; color: #1e40af; font-size: 0.95rem; line-height: 1.5;">
-                        {data.get('mechanism')}
-                    </div>
-                    """, unsafe_allow_html=True)
-
-                    
-                    st.markdown(f"<div class='section-header' style='margin-top: 20px;'>{ICONS['check']} Lifestyle & Diet</div>", unsafe_allow_html=True)
-                    st.markdown(f"""
-                    <div style="background-color: #f0fdf4; border: 1px solid #bbf7d0; border-radius: 8px; padding: 16px; color: #166534; font-size: 0.95rem;">
-                        {data.get('lifestyle_diet', 'No specific restrictions.')}
-                    </div>
-                    """, unsafe_allow_html=True)
-
-                st.markdown("---")
-                st.markdown(f"""
-                <div style="background: #fef2f2; border: 1px solid #fecaca; border-radius: 8px; padding: 16px; display: flex; gap: 12px;">
-                    {ICONS['warning']}
-                    <div>
-                        <strong style="color: #991b1b; font-size: 1rem;">Black Box Warning / Contraindications</strong>
-                        <p style="margin: 4px 0 0 0; color: #7f1d1d; font-size: 0.9rem;">{data.get('warnings')}</p>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-
-            
-            elif intent == "diagnosis":
-                title = data.get('title', data.get('condition', 'Clinical Assessment'))
-                severity_color = "#22c55e" if data.get('severity') == 'Low' else "#eab308" if data.get('severity') == 'Moderate' else "#ef4444"
-                
-                st.markdown(f"""
-                <div style="display: flex; align-items: center; gap: 12px; margin-bottom: 20px; padding-bottom: 15px; border-bottom: 1px solid #e2e8f0;">
-                    {ICONS['radiology']}
-                    <h2 style="margin:0; font-size: 1.4rem;">{title}</h2>
-                    <span style="background:{severity_color}20; color:{severity_color}; padding:4px 12px; border-radius:99px; font-weight:600; font-size:0.8rem; margin-left:auto; border: 1px solid {severity_color}40;">
-                        {data.get('severity', 'Standard').upper()} ACUITY
-                    </span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown(f"""
-                <div style="background-color: #f8fafc; border-left: 4px solid #3b82f6; padding: 16px; border-radius: 0 8px 8px 0; margin-bottom: 20px;">
-                    <strong style="color: #334155; display: block; margin-bottom: 4px;">Executive Summary</strong>
-                    <span style="color: #475569;">{data.get('summary', data.get('description'))}</span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                col_a, col_b = st.columns(2)
-                
-                with col_a:
-                    if data.get('findings'):
-                        st.markdown(f"<div class='section-header'>{ICONS['search']} Key Clinical Findings</div>", unsafe_allow_html=True)
-                        for f in data['findings']: st.markdown(f"• {f}")
-                
-                with col_b:
-                    if data.get('interpretation'):
-                        st.markdown(f"<div class='section-header'>{ICONS['brain']} Clinical Interpretation</div>", unsafe_allow_html=True)
-                        st.info(data.get('interpretation'))
-
-                if data.get('table_data'):
-                    st.markdown(f"<div class='section-header'>{ICONS['chart']} Quantitative Analysis</div>", unsafe_allow_html=True)
-                    st.dataframe(pd.DataFrame(data['table_data']), hide_index=True, use_container_width=True)
-
-                st.markdown(f"<div class='section-header' style='margin-top: 15px;'>{ICONS['check']} Recommended Management Protocol</div>", unsafe_allow_html=True)
-                for rec in data.get('recommendations', []): 
-                    st.markdown(f"""
-                    <div style="background: white; border: 1px solid #e2e8f0; border-left: 4px solid #10b981; padding: 12px; margin-bottom: 8px; border-radius: 4px; box-shadow: 0 1px 2px rgba(0,0,0,0.05);">
-                        {rec}
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                
-                if data.get('lifestyle'):
-                    st.markdown(f"<div class='section-header' style='margin-top: 15px;'>{ICONS['medicine']} Lifestyle Modification</div>", unsafe_allow_html=True)
-                    st.info(data.get('lifestyle'))
-
-            
-            elif intent == "test_info":
-                st.markdown(f"""
-                <div style="display: flex; align-items: center; gap: 12px; margin-bottom: 20px;">
-                    {ICONS['procedure']}
-                    <h2 style="margin:0; font-size: 1.4rem;">Procedure Guide: {data.get('test_name')}</h2>
-                </div>
-                """, unsafe_allow_html=True)
-                st.info(f"**Clinical Indication:** {data.get('purpose')}")
-                t1, t2, t3 = st.tabs(["Step-by-Step Protocol", "Patient Preparation", "Reference Ranges"])
-                with t1: st.markdown(data.get('procedure'))
-                with t2: st.markdown(data.get('preparation'))
-                with t3: st.markdown(f"**Normal Limits:** {data.get('normal_range')}")
+            render_result(st.session_state.intent, st.session_state.result)
+            timing = st.session_state.timing
+            if timing and "replayed" in timing:
+                st.caption(f"Replayed from case history ({time.strftime('%d %b %Y %H:%M', time.localtime(timing['replayed']))}) · no model call")
+            elif timing:
+                caption = f"First content in {timing['ttfc']:.1f}s · Complete in {timing['total']:.1f}s"
+                compaction = timing.get("compaction")
+                if compaction and compaction["tokens_after"] < compaction["tokens_before"]:
+                    caption += f" · Input compacted {compaction['tokens_before']:,} → {compaction['tokens_after']:,} tokens"
+                st.caption(caption)
 
     else:
         
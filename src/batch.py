@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from src.tools import FileTools
+from src.utils import setup_logging
+
+load_dotenv()
+
+SUPPORTED_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg")
+
+
+def iter_input_files(source):
+    """Yields file paths from a directory (recursively) or a manifest with one path per line."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    yield os.path.join(root, name)
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding="utf-8") as manifest:
+            for line in manifest:
+                path = line.strip()
+                if path and not path.startswith("#"):
+                    yield path if os.path.isabs(path) else os.path.join(base, path)
+
+
+def load_checkpoint(output_path):
+    """
+    Returns the set of files already processed successfully in the output JSONL.
+    Files whose record holds an error (e.g. a quota outage) are retried on resume.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if "error" not in record:
+                    done.add(record["file"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+
+def truncate_partial_line(output_path):
+    """Cuts a torn last line (from an interrupted run) so new records start on a line of their own."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position < size:
+            f.truncate(position)
+
+
+def prepare_file(path):
+    """Runs in a worker process: extracts/prepares one file into a MedicalState input."""
+    with open(path, "rb") as f:
+        if path.lower().endswith(".pdf"):
+            # Already inside a pool worker, so extract pages serially here.
+            content = FileTools.extract_pdf(f, workers=1)
+            if content.error:
+                raise ValueError(content.error)
+            return {"user_input": content.text, "input_type": "file", "image_data": content.page_images or None}
+        image = FileTools.process_image(f)
+        if image is None:
+            raise ValueError("Unreadable image")
+        image.load()
+        return {"user_input": "", "input_type": "file", "image_data": image}
+
+
+async def run_file(path, pool, semaphore, timeout):
+    # Imported here so extraction worker processes never load the LLM stack.
+    from src.graph import arun_case
+
+    started = time.perf_counter()
+    record = {"file": path}
+    try:
+        case = await asyncio.get_running_loop().run_in_executor(pool, prepare_file, path)
+    except Exception as e:
+        record["error"] = f"Preparation failed: {type(e).__name__}: {e}"
+    else:
+        async with semaphore:
+            result = await arun_case(case, timeout)
+        if "error" in result:
+            record["error"] = result["error"]
+        else:
+            record["intent"] = result.get("intent")
+            record["structured_response"] = result.get("structured_response")
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+async def process_files(paths, output_path, workers=4, concurrency=4, timeout=120):
+    """
+    Streams files through extraction (process pool) and app_graph (async), appending one
+    JSONL line per file as soon as it finishes. At most 2 x concurrency files are in flight.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    max_in_flight = concurrency * 2
+    pending = set()
+    completed = failed = 0
+
+    def write(tasks, out):
+        nonlocal completed, failed
+        for task in tasks:
+            record = task.result()
+            out.write(json.dumps(record, default=str) + "\n")
+            completed += 1
+            failed += "error" in record
+        out.flush()
+
+    truncate_partial_line(output_path)
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(output_path, "a", encoding="utf-8") as out:
+        for path in paths:
+            if len(pending) >= max_in_flight:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                write(done, out)
+            pending.add(asyncio.create_task(run_file(path, pool, semaphore, timeout)))
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            write(done, out)
+
+    return completed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a directory or manifest of PDFs/images through the CRIS graph.")
+    parser.add_argument("source", help="Directory to scan, or a manifest file with one path per line")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Extraction processes")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent graph executions")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-file graph timeout in seconds")
+    parser.add_argument("--no-resume", action="store_true", help="Reprocess files already in the output")
+    args = parser.parse_args()
+    setup_logging()
+
+    # The offline fake backend (CRIS_LLM_BACKEND=fake) needs no key.
+    if os.getenv("CRIS_LLM_BACKEND", "gemini") != "fake" and not os.getenv("GOOGLE_API_KEY"):
+        parser.error("GOOGLE_API_KEY is not set.")
+
+    done = set() if args.no_resume else load_checkpoint(args.output)
+    if done:
+        print(f"Resuming: skipping {len(done)} files already in {args.output}")
+    paths = (path for path in iter_input_files(args.source) if path not in done)
+
+    started = time.perf_counter()
+    completed, failed = asyncio.run(
+        process_files(paths, args.output, args.workers, args.concurrency, args.timeout)
+    )
+    elapsed = time.perf_counter() - started
+    print(f"Processed {completed} files ({failed} failed) in {elapsed:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
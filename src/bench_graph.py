@@ -0,0 +1,205 @@
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import uuid
+
+SCENARIOS = ("diagnosis", "medicine_info", "test_info", "ambiguous", "image", "pdf")
+
+
+def make_pdf(pages):
+    """Builds a minimal text PDF (one list of lines per page) without extra dependencies."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    font_id = 3 + 2 * len(pages)
+    for i, lines in enumerate(pages):
+        text = " ".join(f"({line}) Tj T*" for line in lines)
+        stream = f"BT /F1 10 Tf 40 780 Td 12 TL {text} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def build_fixtures():
+    from PIL import Image
+
+    image = Image.effect_noise((2400, 1800), 64).convert("RGB")
+    pdf = make_pdf([
+        [f"Page {p + 1} - Laboratory Report - Patient 0001"]
+        + [f"Glucose {90 + (p * 7 + i) % 60} mg/dL (70-99)" for i in range(30)]
+        for p in range(20)
+    ])
+    return image, pdf
+
+
+def make_case(scenario, case_id, image, pdf):
+    """
+    Returns a zero-argument coroutine factory producing one MedicalState for this case.
+    case_id must be unique within the run (across scenarios and concurrency levels), so the
+    response cache never short-circuits the measured path.
+    """
+    from src.tools import FileTools
+
+    texts = {
+        "diagnosis": f"Case {case_id}: 54 y/o patient presents with fever, productive cough and chest pain for 3 days.",
+        "medicine_info": f"Dosage and side effects of metformin in renal impairment, cohort {case_id}",
+        "test_info": f"How should a patient prepare for a colonoscopy? Reference {case_id}",
+        "ambiguous": f"Question {case_id}: what would you suggest here?",
+    }
+    if scenario in texts:
+        async def text_case():
+            return {"user_input": texts[scenario], "input_type": "text", "image_data": None}
+        return text_case
+    if scenario == "image":
+        async def image_case():
+            return {"user_input": "", "input_type": "file", "image_data": image}
+        return image_case
+
+    async def pdf_case():
+        text = await asyncio.to_thread(FileTools.extract_text_from_pdf, io.BytesIO(pdf), workers=1)
+        return {"user_input": f"[{case_id}] {text}", "input_type": "file", "image_data": None}
+    return pdf_case
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+async def run_scenario(scenario, cases, concurrency, image, pdf, timeout, run_id=""):
+    from src.graph import arun_case
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(index):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            case = await make_case(scenario, f"{run_id}-{index}", image, pdf)()
+            result = await arun_case(case, timeout)
+            latencies.append(time.perf_counter() - started)
+            errors += "error" in result
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(cases)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "cases": cases,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "cases_per_sec": round(cases / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_path}:")
+    for row in current:
+        old = baseline.get((row["scenario"], row["concurrency"]))
+        if old and old["p95_ms"] and old["cases_per_sec"]:
+            print(f"{row['scenario']:<14} c={row['concurrency']:<3} "
+                  f"p95 {row['p95_ms'] / old['p95_ms'] - 1:+7.1%}  "
+                  f"throughput {row['cases_per_sec'] / old['cases_per_sec'] - 1:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end throughput benchmark using the fake LLM backend.")
+    parser.add_argument("--cases", type=int, default=40, help="Cases per scenario and concurrency level")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated LLM latency")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="Simulated LLM latency jitter")
+    parser.add_argument("--routing-mode", choices=("sequential", "combined", "speculative"), default="sequential",
+                        help="CRIS_ROUTING_MODE to benchmark")
+    parser.add_argument("--llm-rpm", type=float, default=0,
+                        help="CRIS_LLM_RPM for the ResilientLLM wrapper (0 = unlimited)")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-case timeout in seconds")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous JSON result to diff against")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    # Run in a scratch directory so the benchmark never reads or fills the real caches.
+    os.chdir(tempfile.mkdtemp(prefix="cris-bench-"))
+    os.environ["CRIS_ROUTING_MODE"] = args.routing_mode
+    # Near-duplicate answers would be served from the semantic cache; measure the LLM path.
+    os.environ["CRIS_SEMANTIC_CACHE"] = "off"
+    os.environ["CRIS_LLM_RPM"] = str(args.llm_rpm)
+
+    from src.fake_llm import FakeLLM
+    from src.graph import get_app_graph, set_llm
+
+    # Wrapped in ResilientLLM by set_llm, so the benchmark measures the production call path.
+    set_llm(FakeLLM(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000))
+    get_app_graph()  # compile up front so the first scenario doesn't pay for it
+    nonce = uuid.uuid4().hex[:8]
+    image, pdf = build_fixtures()
+
+    results = []
+    for scenario in args.scenarios.split(","):
+        for level in (int(c) for c in args.concurrency.split(",")):
+            # Each (scenario, level) round gets its own case ids, even when a level is repeated.
+            run_id = f"{nonce}-{len(results)}"
+            row = asyncio.run(run_scenario(scenario.strip(), args.cases, level, image, pdf, args.timeout, run_id))
+            results.append(row)
+            print(f"{row['scenario']:<14} c={level:<3} p50 {row['p50_ms']:8.1f} ms  p95 {row['p95_ms']:8.1f} ms  "
+                  f"p99 {row['p99_ms']:8.1f} ms  {row['cases_per_sec']:8.1f} cases/s  errors {row['errors']}")
+
+    report = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "config": {"cases": args.cases, "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                   "routing_mode": args.routing_mode},
+        "results": results,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Project modules first, then the third-party imports that dominate cold start.
+MODULES = [
+    "src.classifier",
+    "src.cache",
+    "src.tools",
+    "src.graph",
+    "src.batch",
+    "streamlit",
+    "pandas",
+    "PyPDF2",
+    "PIL.Image",
+    "langchain_core.messages",
+    "langgraph.graph",
+    "langchain_google_genai",
+]
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+_BUILD_SNIPPET = (
+    "import time; from src.graph import get_app_graph, get_llm; t = time.perf_counter(); "
+    "get_llm(); get_app_graph(); print(time.perf_counter() - t)"
+)
+
+
+def time_in_fresh_interpreter(snippet, repeat):
+    """Median wall time reported by `snippet`, each run in a new interpreter so nothing is pre-imported."""
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "benchmark-placeholder")
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", snippet], capture_output=True, text=True, env=env, check=True
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cold import time per module.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module (median is reported)")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    parser.add_argument("--max-seconds", type=float,
+                        help="Fail (exit 1) if any src.* module import exceeds this budget")
+    args = parser.parse_args()
+
+    results = {}
+    for module in MODULES:
+        try:
+            results[module] = time_in_fresh_interpreter(_IMPORT_SNIPPET.format(module=module), args.repeat)
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<28} failed: {e.stderr.strip().splitlines()[-1]}")
+    try:
+        results["<first use: llm + graph>"] = time_in_fresh_interpreter(_BUILD_SNIPPET, args.repeat)
+    except subprocess.CalledProcessError as e:
+        print(f"graph build failed: {e.stderr.strip().splitlines()[-1]}")
+
+    for name, seconds in results.items():
+        print(f"{name:<28} {seconds * 1000:8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "import_seconds": results}, f, indent=2)
+
+    if args.max_seconds is not None:
+        over = {m: s for m, s in results.items() if m.startswith("src.") and s > args.max_seconds}
+        if over:
+            for module, seconds in over.items():
+                print(f"Budget exceeded: {module} took {seconds:.3f}s (> {args.max_seconds}s)")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
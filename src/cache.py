@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CACHE_PATH = os.path.join("data", "knowledge_base", "response_cache.sqlite3")
+# Memory-tier hits are written back to SQLite's `accessed` column once this many keys or
+# seconds have accumulated (and before every eviction), so the LRU order on disk reflects
+# them without a write per hit.
+TOUCH_BATCH = 64
+TOUCH_SECONDS = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text):
+    """Lowercases and strips punctuation/extra whitespace so trivial variants share a key."""
+    text = re.sub(r"[^\w\s\-]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def schema_version(schema):
+    """Short hash of a Pydantic schema; changing the model invalidates its cached answers."""
+    payload = json.dumps(schema.model_json_schema(), sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+class ResponseCache:
+    """Two-tier (in-process LRU + SQLite) cache for structured LLM answers."""
+
+    def __init__(self, path=CACHE_PATH, memory_entries=None, max_entries=None, ttl_seconds=None):
+        self.path = path
+        self.memory_entries = memory_entries or int(os.getenv("CRIS_CACHE_MEMORY_ENTRIES", "256"))
+        self.max_entries = max_entries or int(os.getenv("CRIS_CACHE_MAX_ENTRIES", "5000"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("CRIS_CACHE_TTL_HOURS", "168")) * 3600
+        self._memory = OrderedDict()
+        self._touched = {}  # key -> last memory-hit time not yet written to SQLite
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        return self._conn
+
+    def make_key(self, schema, model_name, query):
+        raw = f"{schema.__name__}:{schema_version(schema)}:{model_name}:{normalize_query(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached response dict, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH or now - self._flushed_at > TOUCH_SECONDS:
+                    self._flush_touched()
+                self.hits += 1
+                return json.loads(entry[0])
+
+            try:
+                row = self._db().execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl_seconds:
+                    self._db().execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db().commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return json.loads(row[0])
+            except sqlite3.Error as e:
+                logger.warning("Response cache read error: %s", e)
+
+            self._memory.pop(key, None)
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        payload = json.dumps(value)
+        with self._lock:
+            self._remember(key, payload, now)
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, payload, now, now),
+                )
+                self._writes += 1
+                if self._writes % 50 == 0:
+                    self._evict(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning("Response cache write error: %s", e)
+
+    def _remember(self, key, payload, created):
+        self._memory[key] = (payload, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        touched, self._touched = self._touched, {}
+        self._flushed_at = time.time()
+        try:
+            db = self._db()
+            db.executemany("UPDATE responses SET accessed = ? WHERE key = ?",
+                           [(accessed, key) for key, accessed in touched.items()])
+            db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Response cache write error: %s", e)
+
+    def _evict(self, db, now):
+        """Drops expired rows, then the least recently used rows beyond max_entries."""
+        if self._touched:
+            self._flush_touched()
+        db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,117 @@
+import os
+import re
+import json
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from src.cache import normalize_query
+from src.tools import PAGE_BREAK
+
+# Inputs longer than this are analyzed in chunks and merged (map-reduce).
+CHUNK_CHARS = int(os.getenv("CRIS_CHUNK_CHARS", "24000"))
+CHUNK_CONCURRENCY = int(os.getenv("CRIS_CHUNK_CONCURRENCY", "4"))
+
+SEVERITY_ORDER = ("Low", "Moderate", "High", "Critical")
+
+# Coarsest boundary first: pages, blank-line sections, heading lines, then single lines.
+_SEPARATORS = (
+    (re.compile(re.escape(PAGE_BREAK)), PAGE_BREAK),
+    (re.compile(r"\n\s*\n"), "\n\n"),
+    (re.compile(r"\n(?=[A-Z][A-Z0-9 /&()-]{2,}:?[ \t]*\n)"), "\n"),
+    (re.compile(r"\n"), "\n"),
+)
+
+
+def split_text(text, max_chars=None):
+    """
+    Splits text into chunks of at most max_chars, breaking on page boundaries where
+    possible, then on sections and lines; only a single overlong line is cut mid-text.
+    """
+    max_chars = max_chars or CHUNK_CHARS
+    return [chunk for chunk in _split(text, max_chars, _SEPARATORS) if chunk.strip()]
+
+
+def _split(text, max_chars, separators):
+    if len(text) <= max_chars:
+        return [text]
+    if not separators:
+        return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+    pattern, joiner = separators[0]
+    parts = [part for part in pattern.split(text) if part.strip()]
+    if len(parts) <= 1:
+        return _split(text, max_chars, separators[1:])
+
+    # Pack neighbouring parts greedily so chunks stay close to max_chars.
+    chunks, current = [], ""
+    for part in parts:
+        for piece in _split(part, max_chars, separators[1:]):
+            candidate = current + joiner + piece if current else piece
+            if len(candidate) <= max_chars:
+                current = candidate
+            else:
+                chunks.append(current)
+                current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _unique(items, key):
+    seen = set()
+    result = []
+    for item in items:
+        marker = key(item)
+        if marker not in seen:
+            seen.add(marker)
+            result.append(item)
+    return result
+
+
+def merge_diagnoses(outputs):
+    """
+    Reduces per-chunk DiagnosticOutput dicts into one: the most severe chunk supplies
+    the title and summary, list fields are deduplicated and table rows are unioned.
+    """
+    if len(outputs) == 1:
+        return dict(outputs[0])
+
+    def rank(output):
+        severity = output.get("severity")
+        return SEVERITY_ORDER.index(severity) if severity in SEVERITY_ORDER else -1
+
+    lead = max(outputs, key=rank)  # first of the most severe chunks
+    text_key = lambda item: normalize_query(str(item))
+    return {
+        "title": lead["title"],
+        "summary": lead["summary"],
+        "findings": _unique([f for o in outputs for f in o.get("findings", [])], text_key),
+        "table_data": _unique([row for o in outputs for row in o.get("table_data", [])],
+                              lambda row: json.dumps(row, sort_keys=True, default=str)),
+        "interpretation": "\n\n".join(_unique([o["interpretation"] for o in outputs if o.get("interpretation")], text_key)),
+        "recommendations": _unique([r for o in outputs for r in o.get("recommendations", [])], text_key),
+        "lifestyle": " ".join(_unique([o["lifestyle"] for o in outputs if o.get("lifestyle")], text_key)),
+        "severity": lead["severity"],
+    }
+
+
+def map_chunks(analyze, chunks, concurrency=None):
+    """Runs analyze(chunk, index) over the chunks on a thread pool; results keep chunk order."""
+    concurrency = concurrency or CHUNK_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(chunks)), thread_name_prefix="cris-chunk") as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, analyze, chunk, index)
+            for index, chunk in enumerate(chunks)
+        ]
+        return [future.result() for future in futures]
+
+
+async def amap_chunks(analyze, chunks, concurrency=None):
+    """Async counterpart of map_chunks; analyze is a coroutine function."""
+    semaphore = asyncio.Semaphore(concurrency or CHUNK_CONCURRENCY)
+
+    async def run(chunk, index):
+        async with semaphore:
+            return await analyze(chunk, index)
+
+    return await asyncio.gather(*(run(chunk, index) for index, chunk in enumerate(chunks)))
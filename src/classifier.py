@@ -0,0 +1,164 @@
+import os
+import re
+import threading
+
+# Vocabulary for the local fast-path router. Terms are matched on whole
+# tokens (or token bigrams for multi-word names), so lookups stay O(words).
+DRUG_TERMS = {
+    "acetaminophen", "paracetamol", "tylenol", "panadol", "ibuprofen", "advil", "motrin",
+    "naproxen", "aleve", "aspirin", "diclofenac", "celecoxib", "tramadol", "morphine",
+    "oxycodone", "codeine", "fentanyl", "metformin", "glucophage", "insulin", "glipizide",
+    "gliclazide", "sitagliptin", "empagliflozin", "dapagliflozin", "semaglutide", "ozempic",
+    "liraglutide", "lisinopril", "enalapril", "ramipril", "losartan", "valsartan",
+    "amlodipine", "nifedipine", "metoprolol", "atenolol", "bisoprolol", "propranolol",
+    "carvedilol", "hydrochlorothiazide", "furosemide", "lasix", "spironolactone",
+    "atorvastatin", "lipitor", "simvastatin", "rosuvastatin", "crestor", "warfarin",
+    "coumadin", "apixaban", "eliquis", "rivaroxaban", "xarelto", "clopidogrel", "plavix",
+    "heparin", "digoxin", "amiodarone", "levothyroxine", "synthroid", "prednisone",
+    "prednisolone", "dexamethasone", "hydrocortisone", "omeprazole", "prilosec",
+    "pantoprazole", "esomeprazole", "nexium", "ranitidine", "famotidine", "ondansetron",
+    "zofran", "metoclopramide", "amoxicillin", "augmentin", "azithromycin", "zithromax",
+    "doxycycline", "ciprofloxacin", "levofloxacin", "cephalexin", "ceftriaxone",
+    "clindamycin", "vancomycin", "metronidazole", "flagyl", "nitrofurantoin",
+    "fluconazole", "acyclovir", "valacyclovir", "oseltamivir", "tamiflu", "albuterol",
+    "salbutamol", "ventolin", "montelukast", "singulair", "fluticasone", "budesonide",
+    "cetirizine", "zyrtec", "loratadine", "claritin", "diphenhydramine", "benadryl",
+    "sertraline", "zoloft", "fluoxetine", "prozac", "escitalopram", "lexapro",
+    "citalopram", "paroxetine", "venlafaxine", "duloxetine", "bupropion", "mirtazapine",
+    "amitriptyline", "lithium", "quetiapine", "olanzapine", "risperidone", "aripiprazole",
+    "haloperidol", "diazepam", "valium", "lorazepam", "ativan", "alprazolam", "xanax",
+    "clonazepam", "zolpidem", "ambien", "gabapentin", "neurontin", "pregabalin", "lyrica",
+    "levetiracetam", "lamotrigine", "carbamazepine", "valproate", "phenytoin",
+    "sumatriptan", "methotrexate", "hydroxychloroquine", "allopurinol", "colchicine",
+    "tamsulosin", "finasteride", "sildenafil", "viagra", "tadalafil", "cialis",
+    "estradiol", "progesterone", "testosterone", "alendronate", "vitamin d",
+    "folic acid", "iron sulfate", "ferrous sulfate", "potassium chloride",
+}
+
+DRUG_SUFFIXES = (
+    "pril", "sartan", "olol", "statin", "dipine", "azole", "prazole", "cillin", "mycin",
+    "cycline", "floxacin", "tidine", "gliptin", "gliflozin", "glutide", "xaban", "parin",
+    "triptan", "tinib", "mab", "zepam", "zolam", "oxetine", "setron", "semide", "thiazide",
+    "vir", "lukast",
+)
+
+TEST_TERMS = {
+    "hba1c", "a1c", "cbc", "bmp", "cmp", "lft", "lfts", "tsh", "t3", "t4", "psa", "inr",
+    "ptt", "esr", "crp", "bnp", "troponin", "d-dimer", "lipid panel", "lipid profile",
+    "urinalysis", "creatinine", "egfr", "bun", "ferritin", "hemoglobin", "hematocrit",
+    "platelets", "electrolytes", "blood culture", "blood test", "ecg", "ekg", "eeg", "emg",
+    "echocardiogram", "echo", "mri", "ct", "ct scan", "pet scan", "x-ray", "xray",
+    "ultrasound", "sonogram", "mammogram", "colonoscopy", "endoscopy", "bronchoscopy",
+    "biopsy", "spirometry", "stress test", "holter", "angiogram", "angiography",
+    "dexa", "pap smear", "lumbar puncture", "glucose tolerance", "ogtt", "abg",
+}
+
+TEST_CUES = {
+    "test", "tests", "procedure", "scan", "screening", "preparation", "prepare", "fasting",
+    "normal range", "reference range", "normal limits", "results", "level", "levels",
+}
+
+MEDICINE_CUES = {
+    "dose", "dosage", "dosing", "side effect", "side effects", "mg", "tablet", "tablets",
+    "capsule", "drug", "medication", "medicine", "interaction", "interactions",
+    "contraindication", "contraindications", "mechanism", "overdose", "brand",
+}
+
+SYMPTOM_TERMS = {
+    "pain", "fever", "cough", "headache", "nausea", "vomiting", "diarrhea", "rash",
+    "fatigue", "dizziness", "dyspnea", "shortness of breath", "chest pain", "swelling",
+    "bleeding", "wheezing", "palpitations", "syncope", "numbness", "weakness", "itching",
+    "sore throat", "chills", "sweating", "confusion", "seizure", "jaundice", "edema",
+    "abdominal pain", "back pain", "weight loss", "insomnia", "anxiety", "lump",
+}
+
+DIAGNOSIS_CUES = {
+    "patient", "pt", "presents", "presenting", "complains", "complaint", "history",
+    "symptoms", "symptom", "years old", "year old", "y/o", "yo", "onset", "since",
+    "diagnosis", "differential", "exam", "vitals",
+}
+
+INTENTS = ("diagnosis", "medicine_info", "test_info")
+
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9\-/]*")
+
+
+class IntentClassifier:
+    """Scores a query against the local vocabulary and returns an intent with a confidence."""
+
+    def __init__(self, threshold=None):
+        if threshold is None:
+            threshold = float(os.getenv("CRIS_ROUTER_CONFIDENCE", "0.8"))
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._local_hits = 0
+        self._llm_fallbacks = 0
+        self._terms = {}
+        for intent, weight, terms in (
+            ("medicine_info", 2.0, DRUG_TERMS),
+            ("medicine_info", 1.0, MEDICINE_CUES),
+            ("test_info", 2.0, TEST_TERMS),
+            ("test_info", 1.0, TEST_CUES),
+            ("diagnosis", 2.0, SYMPTOM_TERMS),
+            ("diagnosis", 1.0, DIAGNOSIS_CUES),
+        ):
+            for term in terms:
+                self._terms[term] = (intent, weight)
+
+    def classify(self, text):
+        """Returns (intent, confidence); intent is None when nothing matched."""
+        tokens = _TOKEN_RE.findall(text.lower())
+        if not tokens:
+            return None, 0.0
+
+        scores = dict.fromkeys(INTENTS, 0.0)
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            hit = None
+            if i + 1 < len(tokens):
+                hit = self._terms.get(f"{token} {tokens[i + 1]}")
+            if hit:
+                i += 1
+            else:
+                hit = self._terms.get(token)
+            if hit:
+                scores[hit[0]] += hit[1]
+            elif len(token) > 5 and token.endswith(DRUG_SUFFIXES):
+                scores["medicine_info"] += 1.5
+            i += 1
+
+        # Long free-text entries are almost always case notes.
+        if len(tokens) > 25:
+            scores["diagnosis"] += 1.0
+
+        total = sum(scores.values())
+        if total == 0:
+            return None, 0.0
+        intent = max(scores, key=scores.get)
+        top = scores[intent]
+        confidence = (top / total) * min(1.0, top / 2.0)
+        return intent, round(confidence, 3)
+
+    def route(self, text):
+        """Returns the local intent if it clears the threshold, else None (caller uses the LLM)."""
+        intent, confidence = self.classify(text)
+        with self._lock:
+            if intent and confidence >= self.threshold:
+                self._local_hits += 1
+                return intent
+            self._llm_fallbacks += 1
+            return None
+
+    def stats(self):
+        """Counts of routed queries and the share that skipped the LLM."""
+        with self._lock:
+            total = self._local_hits + self._llm_fallbacks
+            return {
+                "local_hits": self._local_hits,
+                "llm_fallbacks": self._llm_fallbacks,
+                "hit_rate": self._local_hits / total if total else 0.0,
+            }
+
+
+intent_classifier = IntentClassifier()
@@ -0,0 +1,140 @@
+import os
+import re
+from collections import Counter
+from typing import NamedTuple
+from src.tools import PAGE_BREAK
+
+# Header/footer candidates are the first and last EDGE_LINES content lines of each page of a
+# multi-page document. A candidate found on at least this share of pages (and on REPEAT_MIN_PAGES
+# or more) is page furniture: headers, footers and patient banners. Where such lines run unbroken
+# from the top or bottom of a page they are kept on first appearance and dropped elsewhere.
+# Lines in the body of a page are never dropped for repeating.
+EDGE_LINES = int(os.getenv("CRIS_COMPACT_EDGE_LINES", "3"))
+REPEAT_PAGE_FRACTION = float(os.getenv("CRIS_COMPACT_REPEAT_FRACTION", "0.5"))
+REPEAT_MIN_PAGES = 3
+# Shorter lines ("No", "Normal") are form values, not furniture.
+REPEAT_MIN_CHARS = 12
+# Rough estimate, same as the fake backend's usage metadata.
+CHARS_PER_TOKEN = 4
+
+# Whole lines that carry no content wherever they appear.
+FURNITURE = re.compile(
+    r"^(?:"
+    r"page\s*\d+(?:\s*(?:of|/)\s*\d+)?|-\s*\d+\s*-"  # page numbers
+    r"|[-=_*~.·•]{3,}"  # rules and separators
+    r"|(?:printed|generated|exported)\s+(?:on|by|at)\b.*"
+    r"|\(?continued(?:\s+on\s+(?:the\s+)?next\s+page)?\)?|\(?cont(?:'d|inued)\s+from\s+.*"
+    r"|©.*"
+    r"|(?:https?://|www\.)\S+"
+    r")$",
+    re.IGNORECASE,
+)
+
+# Disclaimer wording. Only stripped from header/footer positions of multi-page documents:
+# the same words occur in clinical sentences ("patient disclosed ...", "confidential informant").
+DISCLAIMER = re.compile(
+    r"^(?:"
+    r".*\b(?:copyright|all rights reserved)\b.*"
+    r"|(?:strictly\s+|private\s+and\s+|privileged\s+and\s+)?confidential(?:ity)?(?:\s+(?:notice|statement))?\s*[:.]?"
+    r"|confidential(?:ity)?\s+notice\b.*"
+    r"|(?:confidential\s*[:.-]\s*)?this\s+(?:document|report|message|e-?mail|fax|communication|transmission)\b"
+    r".*\b(?:confidential|privileged|intended\s+(?:only\s+)?for)\b.*"
+    r"|.*\bif you (?:have )?received this\b.*\bin error\b.*"
+    r"|for (?:professional|internal|clinical) use only\.?"
+    r")$",
+    re.IGNORECASE,
+)
+
+
+class Compaction(NamedTuple):
+    text: str
+    tokens_before: int
+    tokens_after: int
+    lines_dropped: int
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _clean_lines(page):
+    """Whitespace-collapsed lines of a page, with blank runs reduced to one empty line."""
+    lines = []
+    for raw in page.splitlines():
+        line = " ".join(raw.split())
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _edges(lines):
+    """Indexes of the first and last EDGE_LINES content lines of a page (blank and furniture lines skipped)."""
+    content = [i for i, line in enumerate(lines) if line and not FURNITURE.match(line)]
+    return content[:EDGE_LINES], content[-EDGE_LINES:][::-1]
+
+
+def _furniture_run(lines, indexes, repeated):
+    """The leading indexes (walking in from a page edge) whose lines are repeated or disclaimers."""
+    run = set()
+    for i in indexes:
+        if lines[i].lower() not in repeated and not DISCLAIMER.match(lines[i]):
+            break
+        run.add(i)
+    return run
+
+
+def _repeated_lines(pages, edges):
+    """Normalized header/footer lines that recur on enough pages to be furniture."""
+    if len(pages) < REPEAT_MIN_PAGES:
+        return set()
+    counts = Counter()
+    for lines, (top, bottom) in zip(pages, edges):
+        counts.update({lines[i].lower() for i in top + bottom if len(lines[i]) >= REPEAT_MIN_CHARS})
+    threshold = max(REPEAT_MIN_PAGES, REPEAT_PAGE_FRACTION * len(pages))
+    repeated = {line for line, count in counts.items() if count >= threshold}
+    if repeated:
+        # The same lab row on several pages is a serial result, not furniture.
+        from src.labs import LAB_LINE
+        repeated = {line for line in repeated if not LAB_LINE.match(line)}
+    return repeated
+
+
+def compact(text):
+    """
+    Strips what the model does not need from record text before prompting: page numbers and
+    separators, headers and footers repeated across pages (kept once), disclaimers in header
+    and footer positions, and redundant whitespace. Page breaks are preserved for chunking.
+    """
+    tokens_before = estimate_tokens(text)
+    pages = [_clean_lines(page) for page in text.split(PAGE_BREAK)]
+    # A single page is typed notes or a one-page record: it has no header/footer to tell apart.
+    edges = [_edges(lines) for lines in pages] if len(pages) > 1 else [([], [])] * len(pages)
+    repeated = _repeated_lines(pages, edges)
+
+    seen = set()
+    dropped = 0
+    compacted = []
+    for lines, (top, bottom) in zip(pages, edges):
+        margins = _furniture_run(lines, top, repeated) | _furniture_run(lines, bottom, repeated)
+        kept = []
+        for i, line in enumerate(lines):
+            if line and (FURNITURE.match(line) or (i in margins and DISCLAIMER.match(line))):
+                dropped += 1
+                continue
+            key = line.lower()
+            if i in margins and key in repeated:
+                if key in seen:
+                    dropped += 1
+                    continue
+                seen.add(key)
+            if line or (kept and kept[-1]):
+                kept.append(line)
+        while kept and not kept[-1]:
+            kept.pop()
+        if kept:
+            compacted.append("\n".join(kept))
+
+    result = ("\n" + PAGE_BREAK).join(compacted)
+    return Compaction(result, tokens_before, estimate_tokens(result), dropped)
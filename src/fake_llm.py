@@ -0,0 +1,177 @@
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Literal, Union, get_args, get_origin
+from langchain_core.messages import AIMessage, AIMessageChunk
+from src.classifier import intent_classifier
+
+
+def _prompt_text(payload):
+    """Flattens a prompt string or a list of messages into plain text."""
+    if isinstance(payload, str):
+        return payload
+    parts = []
+    for message in payload:
+        content = getattr(message, "content", message)
+        if isinstance(content, list):
+            parts.extend(p.get("text", "") for p in content if isinstance(p, dict))
+        else:
+            parts.append(str(content))
+    return "\n".join(parts)
+
+
+def _quoted_request(text):
+    """The user's request inside a prompt (prompts quote it), so instructions don't sway routing."""
+    match = re.search(r'"([^"]*)"', text)
+    return match.group(1) if match else text
+
+
+def _fake_value(name, annotation, seed, text=""):
+    origin = get_origin(annotation)
+    if origin is Literal:
+        options = get_args(annotation)
+        return options[seed % len(options)]
+    if origin is Union:
+        options = [a for a in get_args(annotation) if a is not type(None)]
+        # For intent-tagged unions, answer with the variant a sensible model would pick.
+        intent, _ = intent_classifier.classify(text)
+        for option in options:
+            field = getattr(option, "model_fields", {}).get("intent")
+            if field is not None and intent in get_args(field.annotation):
+                return _fake_value(name, option, seed, text)
+        return _fake_value(name, options[0], seed, text)
+    if origin is list:
+        (item,) = get_args(annotation) or (str,)
+        if item is dict or get_origin(item) is dict:
+            return [{"Analyte": "Glucose", "Value": str(90 + seed % 60), "Unit": "mg/dL", "Reference": "70-99"}]
+        return [f"Simulated {name.replace('_', ' ')} {i + 1}" for i in range(1 + seed % 3)]
+    if annotation is int:
+        return seed % 100
+    if annotation is float:
+        return (seed % 1000) / 10
+    if annotation is bool:
+        return bool(seed % 2)
+    if hasattr(annotation, "model_fields"):
+        return build_fake_output(annotation, seed, text)
+    return f"Simulated {name.replace('_', ' ')}."
+
+
+def build_fake_output(schema, seed=0, text=""):
+    """Builds a valid, deterministic instance of a Pydantic output schema."""
+    data = {}
+    for name, field in schema.model_fields.items():
+        if name == "intent" and get_origin(field.annotation) is Literal:
+            # Route like a sensible model would so each specialist path gets exercised.
+            intent, _ = intent_classifier.classify(text)
+            data[name] = intent if intent in get_args(field.annotation) else get_args(field.annotation)[0]
+        else:
+            data[name] = _fake_value(name, field.annotation, seed, text)
+    return schema(**data)
+
+
+def _fake_json_value(name, prop, seed):
+    """Value for one property of a JSON schema (used when streaming raw JSON text)."""
+    if "enum" in prop:
+        return prop["enum"][seed % len(prop["enum"])]
+    kind = prop.get("type")
+    if kind == "array":
+        if prop.get("items", {}).get("type") == "object":
+            return [{"Analyte": "Glucose", "Value": str(90 + seed % 60), "Unit": "mg/dL", "Reference": "70-99"}]
+        return [f"Simulated {name.replace('_', ' ')} {i + 1}" for i in range(1 + seed % 3)]
+    if kind == "integer":
+        return seed % 100
+    if kind == "number":
+        return (seed % 1000) / 10
+    if kind == "boolean":
+        return bool(seed % 2)
+    return f"Simulated {name.replace('_', ' ')}."
+
+
+class FakeStructuredLLM:
+    def __init__(self, llm, schema, include_raw=False):
+        self.llm = llm
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def _respond(self, payload):
+        text = _prompt_text(payload)
+        seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+        parsed = build_fake_output(self.schema, seed, _quoted_request(text))
+        if not self.include_raw:
+            return parsed
+        body = parsed.model_dump_json()
+        # Rough 4-characters-per-token estimate so token metrics have realistic magnitudes.
+        raw = AIMessage(content=body, usage_metadata={
+            "input_tokens": len(text) // 4 + 1,
+            "output_tokens": len(body) // 4 + 1,
+            "total_tokens": (len(text) + len(body)) // 4 + 2,
+        })
+        return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+    def invoke(self, payload, config=None, **kwargs):
+        time.sleep(self.llm.next_delay())
+        return self._respond(payload)
+
+    async def ainvoke(self, payload, config=None, **kwargs):
+        await asyncio.sleep(self.llm.next_delay())
+        return self._respond(payload)
+
+
+class FakeLLM:
+    """
+    Offline stand-in for the Gemini chat model. Returns valid structured outputs
+    after a simulated latency of `latency` +/- `jitter` seconds (seeded, so runs repeat).
+    """
+
+    model = "fake"
+
+    def __init__(self, latency=0.05, jitter=0.02, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_delay(self):
+        with self._lock:
+            self.calls += 1
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def _stream_chunks(self, payload):
+        """
+        Emulates a model answering a JSON-instruction prompt: reads the schema after the
+        "JSON schema:" marker and returns the answer split into small text chunks.
+        """
+        text = _prompt_text(payload)
+        seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+        schema = json.loads(text.rsplit("JSON schema:", 1)[1]) if "JSON schema:" in text else {"properties": {}}
+        body = json.dumps({
+            name: _fake_json_value(name, prop, seed) for name, prop in schema.get("properties", {}).items()
+        })
+        pieces = [body[i:i + 24] for i in range(0, len(body), 24)] or [""]
+        usage = {"input_tokens": len(text) // 4 + 1, "output_tokens": len(body) // 4 + 1,
+                 "total_tokens": (len(text) + len(body)) // 4 + 2}
+        chunks = [AIMessageChunk(content=piece) for piece in pieces[:-1]]
+        chunks.append(AIMessageChunk(content=pieces[-1], usage_metadata=usage))
+        return chunks
+
+    def stream(self, payload, config=None, **kwargs):
+        chunks = self._stream_chunks(payload)
+        delay = self.next_delay() / len(chunks)
+        for chunk in chunks:
+            time.sleep(delay)
+            yield chunk
+
+    async def astream(self, payload, config=None, **kwargs):
+        chunks = self._stream_chunks(payload)
+        delay = self.next_delay() / len(chunks)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        return FakeStructuredLLM(self, schema, include_raw)
@@ -1,15 +1,26 @@
 import os
-import base64
-import io
-from typing import TypedDict, Any, List, Optional, Literal
-from langgraph.graph import StateGraph, END
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict, Any, List, Optional, Literal, Union
 from langchain_core.messages import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from dotenv import load_dotenv
+from src.classifier import intent_classifier
+from src.cache import response_cache, schema_version
+from src.knowledge import monograph_index
+from src.telemetry import span, annotate, traced, metrics
+from src.streaming import PartialJSONParser, json_instructions, chunk_text
+from src.chunking import CHUNK_CHARS, split_text, merge_diagnoses, map_chunks, amap_chunks
+from src.tools import FileTools, ImagePayload
+from src.compaction import compact
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class RouterOutput(BaseModel):
     """Determines the intent of the user."""
     intent: Literal["diagnosis", "medicine_info", "test_info"]
@@ -44,12 +55,77 @@ class TestInfoOutput(BaseModel):
     preparation: str
     normal_range: str
 
+# Variants of the specialist schemas tagged with their intent, so one call can
+# both classify and answer (CRIS_ROUTING_MODE=combined).
+class DiagnosisAnswer(DiagnosticOutput):
+    intent: Literal["diagnosis"]
+
+class MedicineAnswer(PharmacistOutput):
+    intent: Literal["medicine_info"]
+
+class TestInfoAnswer(TestInfoOutput):
+    intent: Literal["test_info"]
+
+class CombinedOutput(BaseModel):
+    """Intent and specialist answer in a single response."""
+    answer: Union[DiagnosisAnswer, MedicineAnswer, TestInfoAnswer] = Field(discriminator="intent")
 
-llm = ChatGoogleGenerativeAI(
-    model="models/gemini-2.0-flash", 
-    temperature=0, 
-    google_api_key=os.getenv("GOOGLE_API_KEY")
-)
+SCHEMA_INTENTS = {DiagnosticOutput: "diagnosis", PharmacistOutput: "medicine_info", TestInfoOutput: "test_info"}
+
+
+MODEL_NAME = "models/gemini-2.0-flash"
+
+# sequential: router call, then specialist call.
+# combined: one call returning CombinedOutput for short text-only requests, sequential otherwise.
+# speculative: the classifier's best-guess specialist runs alongside the router call.
+ROUTING_MODE = os.getenv("CRIS_ROUTING_MODE", "sequential")
+SPECULATE_CONFIDENCE = float(os.getenv("CRIS_SPECULATE_CONFIDENCE", "0.3"))
+
+# The Gemini client and the compiled graph are built on first use, not at import,
+# so importing this module (e.g. from app.py) stays cheap.
+_llm = None
+_app_graph = None
+_build_lock = threading.Lock()
+
+def get_llm():
+    """
+    Returns the shared chat model, creating it on first call. It is wrapped in
+    ResilientLLM (coalescing, rate limit, retries, circuit breaker).
+    CRIS_LLM_BACKEND=fake swaps in the offline FakeLLM (for benchmarks and load tests).
+    """
+    global _llm
+    if _llm is None:
+        with _build_lock:
+            if _llm is None:
+                from src.llm_client import ResilientLLM
+                if os.getenv("CRIS_LLM_BACKEND", "gemini") == "fake":
+                    from src.fake_llm import FakeLLM
+                    base = FakeLLM(
+                        latency=float(os.getenv("CRIS_FAKE_LATENCY_MS", "50")) / 1000,
+                        jitter=float(os.getenv("CRIS_FAKE_JITTER_MS", "20")) / 1000,
+                    )
+                else:
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    base = ChatGoogleGenerativeAI(
+                        model=MODEL_NAME, 
+                        temperature=0, 
+                        google_api_key=os.getenv("GOOGLE_API_KEY"),
+                        max_retries=0,  # retries are handled (and counted) by ResilientLLM
+                    )
+                _llm = ResilientLLM(base)
+    return _llm
+
+def set_llm(llm, resilient=True):
+    """
+    Replaces the shared chat model (e.g. with a FakeLLM); nodes pick it up on their next call.
+    It is wrapped in ResilientLLM like the built-in model unless resilient=False.
+    """
+    global _llm
+    if resilient:
+        from src.llm_client import ResilientLLM
+        if not isinstance(llm, ResilientLLM):
+            llm = ResilientLLM(llm)
+    _llm = llm
 
 
 class MedicalState(TypedDict):
@@ -58,48 +134,119 @@ class MedicalState(TypedDict):
     input_type: str          
     intent: str              
     structured_response: dict 
+    compaction: dict
 
 
 
-def router_node(state: MedicalState):
-    if state['input_type'] == 'file':
-        return {"intent": "diagnosis"}
-    
-    structured_llm = llm.with_structured_output(RouterOutput)
-    response = structured_llm.invoke(f"Classify the medical intent of: {state['user_input']}")
-    return {"intent": response.intent}
+def _router_prompt(state: MedicalState):
+    return f"Classify the medical intent of: {state['user_input']}"
 
-def diagnostician_node(state: MedicalState):
-    print("--- DIAGNOSTICIAN RUNNING ---")
-    structured_llm = llm.with_structured_output(DiagnosticOutput)
-    
-    if state.get('image_data'):
-        img = state['image_data']
-        buffered = io.BytesIO()
-        img.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        
-        message = HumanMessage(
-            content=[
-                {"type": "text", "text": "Analyze this clinical image strictly. Identify pathologies, severity, recommend next steps, and suggest lifestyle/dietary changes if relevant."},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_str}"}}
-            ]
-        )
-        response = structured_llm.invoke([message])
+def _image_batches(state: MedicalState):
+    """
+    Encodes the case's image(s) for the vision call. A multi-image study (a list) is
+    first deduplicated by perceptual hash, then grouped into batches within the payload budget.
+    Scanned PDF pages arrive already encoded (ImagePayload) and are never deduplicated.
+    """
+    images = state['image_data']
+    if not isinstance(images, (list, tuple)):
+        return [[FileTools.prepare_image_payload(images)]]
+
+    payloads = [image for image in images if isinstance(image, ImagePayload)]
+    frames = [image for image in images if image is not None and not isinstance(image, ImagePayload)]
+    if not payloads and not frames:
+        raise ValueError("None of the uploaded images could be read.")
+    if frames:
+        kept, dropped, dropped_bytes = FileTools.dedupe_frames(frames)
+        metrics.inc("cris_frames_total", len(frames))
+        metrics.inc("cris_frames_dropped_total", dropped)
+        metrics.inc("cris_frames_dropped_bytes_total", dropped_bytes)
+        annotate(frames=len(frames), frames_dropped=dropped, dropped_bytes=dropped_bytes)
+        payloads += [FileTools.prepare_image_payload(image) for image in kept]
+    return FileTools.batch_payloads(payloads)
+
+def _vision_message(batch, index=0, total=1, notes=None, lab_context=None):
+    if len(batch) == 1 and total == 1:
+        instruction = "Analyze this clinical image strictly. Identify pathologies, severity, recommend next steps, and suggest lifestyle/dietary changes if relevant."
     else:
-        prompt = f"""
+        part = f" (part {index + 1} of {total})" if total > 1 else ""
+        instruction = (
+            f"Analyze these {len(batch)} images from one clinical case{part}; they are imaging views or slices, "
+            "or scanned pages of the patient's record. "
+            "Identify pathologies, severity, recommend next steps, and suggest lifestyle/dietary changes if relevant."
+        )
+    if notes:
+        # Pages of the same PDF that do have a text layer.
+        instruction += f'\nText pages of the same record: "{notes}"{_lab_section(lab_context)}'
+    content = [{"type": "text", "text": instruction}]
+    content += [{"type": "image_url", "image_url": {"url": payload.data_url}} for payload in batch]
+    return [HumanMessage(content=content)]
+
+def _diagnostician_input(state: MedicalState, batches=None):
+    """Builds the vision message for image cases, or the text prompt otherwise."""
+    if state.get('image_data'):
+        return _vision_message((batches or _image_batches(state))[0], notes=state['user_input'].strip(),
+                               lab_context=state.get('lab_context'))
+    return f"""
         Act as a senior internal medicine physician. 
-        Analyze these symptoms: "{state['user_input']}"
+        Analyze these symptoms: "{state['user_input']}"{_lab_section(state.get('lab_context'))}
         Provide a differential diagnosis, acuity assessment, management plan, and specific lifestyle/dietary advice.
         """
-        response = structured_llm.invoke(prompt)
-        
-    return {"structured_response": response.model_dump()}
 
-def pharmacist_node(state: MedicalState):
-    print("--- PHARMACIST RUNNING ---")
-    structured_llm = llm.with_structured_output(PharmacistOutput)
-    prompt = f"""
+def _diagnostician_chunk_prompt(chunk, index, total, lab_context=None):
+    return f"""
+        Act as a senior internal medicine physician.
+        This is part {index + 1} of {total} of a longer clinical record; analyze only what this part contains.
+        Record excerpt: "{chunk}"{_lab_section(lab_context)}
+        Provide a differential diagnosis, acuity assessment, management plan, and specific lifestyle/dietary advice.
+        """
+
+def _lab_section(lab_context):
+    if not lab_context:
+        return ""
+    return f"""
+        Lab results parsed from the record (analyte (unit, reference range): values; H/L = out of range):
+        {lab_context}"""
+
+def _extract_labs(state: MedicalState):
+    """
+    Replaces lab lines in text input with compact parsed context.
+    Returns (state for prompting, table_data rows or None when the text holds no lab table).
+    """
+    if not state['user_input'].strip():
+        return state, None
+    from src.labs import LAB_MIN_ROWS, parse_labs, lab_context, table_data
+    labs, narrative = parse_labs(state['user_input'])
+    if len(labs) < LAB_MIN_ROWS:
+        return state, None
+    annotate(lab_rows=len(labs))
+    return {**state, "user_input": narrative, "lab_context": lab_context(labs)}, table_data(labs)
+
+def _diagnosis_result(result, table):
+    # Parsed lab values are deterministic; they replace whatever table the model produced.
+    if table is not None:
+        result["table_data"] = table
+    return {"structured_response": result}
+
+def _record_parts(state: MedicalState, batches=None):
+    """
+    Separate prompts for a case too large for one call: a vision message per image batch
+    and a prompt per chunk of the text. None when a single call covers the case.
+    """
+    text = state['user_input']
+    if len(batches or []) <= 1 and len(text) <= CHUNK_CHARS:
+        return None
+    chunks = split_text(text) if text.strip() else []
+    annotate(chunks=len(chunks))
+    total = len(batches or []) + len(chunks)
+    parts = [_vision_message(batch, index, total) for index, batch in enumerate(batches or [])]
+    parts += [
+        _diagnostician_chunk_prompt(chunk, len(parts) + index, total, state.get('lab_context') if index == 0 else None)
+        for index, chunk in enumerate(chunks)
+    ]
+    return parts
+
+def _pharmacist_prompt(state: MedicalState):
+    return f"""
     Provide a COMPREHENSIVE pharmacological profile for: "{state['user_input']}".
     You MUST include:
     1. Common brand names.
@@ -108,35 +255,481 @@ def pharmacist_node(state: MedicalState):
     4. Diet interactions (e.g., food/alcohol) and lifestyle advice.
     5. Safety warnings.
     """
-    response = structured_llm.invoke(prompt)
-    return {"structured_response": response.model_dump()}
 
-def educator_node(state: MedicalState):
-    print("--- EDUCATOR RUNNING ---")
-    structured_llm = llm.with_structured_output(TestInfoOutput)
-    prompt = f"""
+def _combined_prompt(state: MedicalState):
+    return f"""
+    Classify the medical intent of the request below, then answer it in the matching format:
+    - diagnosis: act as a senior internal medicine physician; give a differential diagnosis, acuity assessment, management plan and lifestyle/dietary advice.
+    - medicine_info: give a comprehensive pharmacological profile (brand names, mechanism, dosage, diet interactions and lifestyle advice, safety warnings).
+    - test_info: explain the procedure/test, covering preparation, interpretation and normal ranges.
+    Request: "{state['user_input']}"
+    """
+
+def _educator_prompt(state: MedicalState):
+    return f"""
     Explain this medical procedure/test: "{state['user_input']}".
     Cover preparation, interpretation, and normal ranges.
     """
-    response = structured_llm.invoke(prompt)
-    return {"structured_response": response.model_dump()}
 
-# GRAPH 
-workflow = StateGraph(MedicalState)
-workflow.add_node("router", router_node)
-workflow.add_node("diagnostician", diagnostician_node)
-workflow.add_node("pharmacist", pharmacist_node)
-workflow.add_node("educator", educator_node)
+def _compact_input(state: MedicalState):
+    """Compacts the case text once, at the graph entry. Returns (state, update for the graph state)."""
+    if not state['user_input'].strip():
+        return state, {}
+    result = compact(state['user_input'])
+    metrics.inc("cris_prompt_tokens_total", result.tokens_before, stage="raw")
+    metrics.inc("cris_prompt_tokens_total", result.tokens_after, stage="compacted")
+    annotate(tokens_before=result.tokens_before, tokens_after=result.tokens_after, lines_dropped=result.lines_dropped)
+    update = {
+        "user_input": result.text,
+        "compaction": {"tokens_before": result.tokens_before, "tokens_after": result.tokens_after,
+                       "lines_dropped": result.lines_dropped},
+    }
+    return {**state, **update}, update
+
+def _local_intent(state: MedicalState):
+    """Resolves the intent without the LLM when possible; None means ask the model."""
+    if state['input_type'] == 'file':
+        return "diagnosis"
+    # Short reference queries are usually settled by the local classifier.
+    intent = intent_classifier.route(state['user_input'])
+    metrics.inc("cris_router_decisions_total", source="local" if intent else "llm")
+    return intent
+
+def _cache_key(schema, state: MedicalState):
+    # Keyed on the active model so answers from a different backend never mix.
+    model_name = getattr(get_llm(), "model", MODEL_NAME)
+    return response_cache.make_key(schema, model_name, state['user_input'])
+
+def _cache_lookup(schema, state: MedicalState):
+    """Checks the local monograph index, then the response cache. Returns (cache_key, answer or None)."""
+    kind = "medicine" if schema is PharmacistOutput else "test"
+    record = monograph_index.lookup(state['user_input'], kind)
+    if record is not None:
+        try:
+            answer = schema(**record).model_dump()
+            annotate(cache_hit="monograph")
+            return None, answer
+        except ValidationError:
+            pass  # incomplete monograph; let the model answer
+
+    cache_key = _cache_key(schema, state)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        annotate(cache_hit="response")
+        return cache_key, cached
+    return cache_key, _semantic_lookup(schema, state)
+
+def _semantic_namespace(schema):
+    model_name = getattr(get_llm(), "model", MODEL_NAME)
+    return f"{schema.__name__}:{schema_version(schema)}:{model_name}"
+
+def _semantic_cache():
+    """The semantic cache, or None when disabled. Imported on first use: it pulls in numpy."""
+    from src.semantic_cache import semantic_cache, ENABLED
+    return semantic_cache if ENABLED else None
+
+def _semantic_lookup(schema, state: MedicalState):
+    """A cached answer to a near-identical query of the same intent, or None."""
+    semantic_cache = _semantic_cache()
+    if semantic_cache is None or state.get('image_data'):
+        return None
+    match = semantic_cache.lookup(_semantic_namespace(schema), SCHEMA_INTENTS[schema], state['user_input'])
+    if match is None:
+        return None
+    answer, similarity = match
+    annotate(cache_hit="semantic", similarity=round(similarity, 3))
+    return answer
+
+def _semantic_store(schema, state: MedicalState, update):
+    semantic_cache = _semantic_cache()
+    if semantic_cache is not None and not state.get('image_data'):
+        semantic_cache.add(_semantic_namespace(schema), SCHEMA_INTENTS[schema], state['user_input'],
+                           update["structured_response"])
+    return update
+
+def _payload_bytes(payload):
+    """Approximate request size: prompt text plus any inline image data."""
+    if isinstance(payload, str):
+        return len(payload)
+    total = 0
+    for message in payload:
+        parts = message.content if isinstance(message.content, list) else [message.content]
+        for part in parts:
+            if isinstance(part, dict):
+                total += len(part.get("text", "")) + len(part.get("image_url", {}).get("url", ""))
+            else:
+                total += len(str(part))
+    return total
+
+def _unpack_structured(result, llm_span):
+    """Records token usage from the raw message and returns the parsed schema instance."""
+    usage = getattr(result["raw"], "usage_metadata", None) or {}
+    llm_span.set(prompt_tokens=usage.get("input_tokens"), response_tokens=usage.get("output_tokens"))
+    if result.get("parsing_error"):
+        raise result["parsing_error"]
+    if result.get("parsed") is None:
+        raise ValueError("Model returned no structured output.")
+    return result["parsed"]
+
+_speculative = contextvars.ContextVar("cris_speculative", default=False)
+
+def _streaming_requested():
+    """True when the graph was started by stream_case (field-level streaming)."""
+    if _speculative.get():
+        return False  # a speculative answer may be discarded; never show it
+    try:
+        from langgraph.config import get_config
+        return bool(get_config().get("configurable", {}).get("stream_fields"))
+    except RuntimeError:
+        return False
+
+def _with_json_instructions(schema, payload):
+    suffix = json_instructions(schema)
+    if isinstance(payload, str):
+        return payload + suffix
+    message = payload[-1]
+    content = message.content if isinstance(message.content, list) else [{"type": "text", "text": message.content}]
+    return payload[:-1] + [HumanMessage(content=content + [{"type": "text", "text": suffix}])]
+
+def _finish_stream(schema, parser, message, llm_span):
+    usage = getattr(message, "usage_metadata", None) or {}
+    llm_span.set(prompt_tokens=usage.get("input_tokens"), response_tokens=usage.get("output_tokens"))
+    return schema.model_validate(parser.fields)
+
+def _stream_structured(schema, payload):
+    """Streams a JSON answer, pushing each top-level field to the graph's custom stream as it completes."""
+    from langgraph.config import get_stream_writer
+    writer = get_stream_writer()
+    parser = PartialJSONParser()
+    message = None
+    with span(f"llm.{schema.__name__}", payload_bytes=_payload_bytes(payload), streamed=True) as llm_span:
+        for chunk in get_llm().stream(_with_json_instructions(schema, payload)):
+            message = chunk if message is None else message + chunk
+            for key, value in parser.feed(chunk_text(chunk)):
+                writer({"field": key, "value": value})
+        return _finish_stream(schema, parser, message, llm_span)
 
-workflow.set_entry_point("router")
+async def _astream_structured(schema, payload):
+    from langgraph.config import get_stream_writer
+    writer = get_stream_writer()
+    parser = PartialJSONParser()
+    message = None
+    with span(f"llm.{schema.__name__}", payload_bytes=_payload_bytes(payload), streamed=True) as llm_span:
+        async for chunk in get_llm().astream(_with_json_instructions(schema, payload)):
+            message = chunk if message is None else message + chunk
+            for key, value in parser.feed(chunk_text(chunk)):
+                writer({"field": key, "value": value})
+        return _finish_stream(schema, parser, message, llm_span)
 
+def _invoke_structured(schema, payload, stream=False):
+    if stream and _streaming_requested():
+        try:
+            return _stream_structured(schema, payload)
+        except ValidationError as e:
+            logger.warning("Streamed %s was incomplete, retrying without streaming: %s", schema.__name__, e)
+    structured_llm = get_llm().with_structured_output(schema, include_raw=True)
+    with span(f"llm.{schema.__name__}", payload_bytes=_payload_bytes(payload)) as llm_span:
+        return _unpack_structured(structured_llm.invoke(payload), llm_span)
+
+async def _ainvoke_structured(schema, payload, stream=False):
+    if stream and _streaming_requested():
+        try:
+            return await _astream_structured(schema, payload)
+        except ValidationError as e:
+            logger.warning("Streamed %s was incomplete, retrying without streaming: %s", schema.__name__, e)
+    structured_llm = get_llm().with_structured_output(schema, include_raw=True)
+    with span(f"llm.{schema.__name__}", payload_bytes=_payload_bytes(payload)) as llm_span:
+        return _unpack_structured(await structured_llm.ainvoke(payload), llm_span)
+
+def _cache_store(cache_key, response, state: MedicalState):
+    result = response.model_dump()
+    response_cache.set(cache_key, result)
+    return _semantic_store(type(response), state, {"structured_response": result})
+
+
+def _combined_result(response, state: MedicalState):
+    """Splits a CombinedOutput into the usual intent/structured_response pair."""
+    answer = response.answer
+    result = answer.model_dump(exclude={"intent"})
+    schema = {"medicine_info": PharmacistOutput, "test_info": TestInfoOutput}.get(answer.intent)
+    if schema is not None:
+        # Lets a later, locally routed repeat of this query hit the specialist's cache.
+        response_cache.set(_cache_key(schema, state), result)
+        _semantic_store(schema, state, {"structured_response": result})
+    return {"intent": answer.intent, "structured_response": result}
+
+def _use_combined(state: MedicalState):
+    """
+    Combined routing only answers short, text-only requests. Images, long records and lab
+    tables go through the router to the diagnostician's vision, chunking and lab parsing.
+    """
+    if ROUTING_MODE != "combined":
+        return False
+    text = state['user_input']
+    if state.get('image_data') or len(text) > CHUNK_CHARS:
+        return False
+    from src.labs import LAB_MIN_ROWS, parse_labs
+    return len(parse_labs(text)[0]) < LAB_MIN_ROWS
+
+def _speculation_target(state: MedicalState):
+    """The specialist worth starting before the router answers, or None."""
+    if ROUTING_MODE != "speculative":
+        return None
+    intent, confidence = intent_classifier.classify(state['user_input'])
+    return intent if intent and confidence >= SPECULATE_CONFIDENCE else None
+
+def _run_speculative(node, state):
+    _speculative.set(True)
+    return node(state)
+
+async def _arun_speculative(node, state):
+    _speculative.set(True)
+    return await node(state)
+
+
+@traced("node.router")
+def router_node(state: MedicalState):
+    state, update = _compact_input(state)
+    return {**update, **_route(state)}
+
+def _route(state: MedicalState):
+    intent = _local_intent(state)
+    if intent:
+        return {"intent": intent}
+
+    if _use_combined(state):
+        return _combined_result(_invoke_structured(CombinedOutput, _combined_prompt(state)), state)
+
+    guess = _speculation_target(state)
+    if guess is None:
+        response = _invoke_structured(RouterOutput, _router_prompt(state))
+        return {"intent": response.intent}
+
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cris-speculative")
+    future = pool.submit(contextvars.copy_context().run, _run_speculative, SPECIALISTS[guess], state)
+    pool.shutdown(wait=False)
+    try:
+        intent = _invoke_structured(RouterOutput, _router_prompt(state)).intent
+    except BaseException:
+        future.cancel()
+        raise
+    if intent != guess:
+        # A call already in flight cannot be interrupted; its answer is simply dropped.
+        future.cancel()
+        metrics.inc("cris_speculation_total", outcome="miss")
+        return {"intent": intent}
+    metrics.inc("cris_speculation_total", outcome="hit")
+    try:
+        return {"intent": intent, **future.result()}
+    except Exception as e:
+        logger.warning("Speculative %s failed, running it again: %s", guess, e)
+        return {"intent": intent}
+
+@traced("node.diagnostician")
+def diagnostician_node(state: MedicalState):
+    cached = _semantic_lookup(DiagnosticOutput, state)
+    if cached is not None:
+        return {"structured_response": cached}
+    return _semantic_store(DiagnosticOutput, state, _diagnose(state))
+
+def _diagnose(state: MedicalState):
+    state, table = _extract_labs(state)
+    batches = _image_batches(state) if state.get('image_data') else None
+    parts = _record_parts(state, batches)
+    if parts:
+        def analyze(payload, index):
+            return _invoke_structured(DiagnosticOutput, payload).model_dump()
+        merged = merge_diagnoses(map_chunks(analyze, parts))
+        return _diagnosis_result(DiagnosticOutput(**merged).model_dump(), table)
+
+    response = _invoke_structured(DiagnosticOutput, _diagnostician_input(state, batches), stream=True)
+    return _diagnosis_result(response.model_dump(), table)
+
+@traced("node.pharmacist")
+def pharmacist_node(state: MedicalState):
+    cache_key, cached = _cache_lookup(PharmacistOutput, state)
+    if cached is not None:
+        return {"structured_response": cached}
+
+    response = _invoke_structured(PharmacistOutput, _pharmacist_prompt(state), stream=True)
+    return _cache_store(cache_key, response, state)
+
+@traced("node.educator")
+def educator_node(state: MedicalState):
+    cache_key, cached = _cache_lookup(TestInfoOutput, state)
+    if cached is not None:
+        return {"structured_response": cached}
+
+    response = _invoke_structured(TestInfoOutput, _educator_prompt(state), stream=True)
+    return _cache_store(cache_key, response, state)
+
+# ASYNC NODES (used by app_graph.ainvoke / run_batch)
+@traced("node.router")
+async def arouter_node(state: MedicalState):
+    state, update = await asyncio.to_thread(_compact_input, state)
+    return {**update, **(await _aroute(state))}
+
+async def _aroute(state: MedicalState):
+    intent = _local_intent(state)
+    if intent:
+        return {"intent": intent}
+
+    if _use_combined(state):
+        return _combined_result(await _ainvoke_structured(CombinedOutput, _combined_prompt(state)), state)
+
+    guess = _speculation_target(state)
+    if guess is None:
+        response = await _ainvoke_structured(RouterOutput, _router_prompt(state))
+        return {"intent": response.intent}
+
+    task = asyncio.create_task(_arun_speculative(ASYNC_SPECIALISTS[guess], state))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())  # never "exception was never retrieved"
+    try:
+        intent = (await _ainvoke_structured(RouterOutput, _router_prompt(state))).intent
+    except BaseException:
+        task.cancel()
+        raise
+    if intent != guess:
+        task.cancel()
+        metrics.inc("cris_speculation_total", outcome="miss")
+        return {"intent": intent}
+    metrics.inc("cris_speculation_total", outcome="hit")
+    try:
+        return {"intent": intent, **(await task)}
+    except Exception as e:
+        logger.warning("Speculative %s failed, running it again: %s", guess, e)
+        return {"intent": intent}
+
+@traced("node.diagnostician")
+async def adiagnostician_node(state: MedicalState):
+    cached = await asyncio.to_thread(_semantic_lookup, DiagnosticOutput, state)
+    if cached is not None:
+        return {"structured_response": cached}
+    return await asyncio.to_thread(_semantic_store, DiagnosticOutput, state, await _adiagnose(state))
+
+async def _adiagnose(state: MedicalState):
+    # Lab parsing and image encoding are CPU-bound; keep them off the event loop.
+    state, table = await asyncio.to_thread(_extract_labs, state)
+    batches = await asyncio.to_thread(_image_batches, state) if state.get('image_data') else None
+    parts = _record_parts(state, batches)
+    if parts:
+        async def analyze(payload, index):
+            return (await _ainvoke_structured(DiagnosticOutput, payload)).model_dump()
+        merged = merge_diagnoses(await amap_chunks(analyze, parts))
+        return _diagnosis_result(DiagnosticOutput(**merged).model_dump(), table)
+
+    payload = await asyncio.to_thread(_diagnostician_input, state, batches)
+    response = await _ainvoke_structured(DiagnosticOutput, payload, stream=True)
+    return _diagnosis_result(response.model_dump(), table)
+
+@traced("node.pharmacist")
+async def apharmacist_node(state: MedicalState):
+    # The cache reads are blocking SQLite/index I/O; keep them off the event loop.
+    cache_key, cached = await asyncio.to_thread(_cache_lookup, PharmacistOutput, state)
+    if cached is not None:
+        return {"structured_response": cached}
+
+    response = await _ainvoke_structured(PharmacistOutput, _pharmacist_prompt(state), stream=True)
+    return await asyncio.to_thread(_cache_store, cache_key, response, state)
+
+@traced("node.educator")
+async def aeducator_node(state: MedicalState):
+    cache_key, cached = await asyncio.to_thread(_cache_lookup, TestInfoOutput, state)
+    if cached is not None:
+        return {"structured_response": cached}
+
+    response = await _ainvoke_structured(TestInfoOutput, _educator_prompt(state), stream=True)
+    return await asyncio.to_thread(_cache_store, cache_key, response, state)
+
+SPECIALISTS = {"diagnosis": diagnostician_node, "medicine_info": pharmacist_node, "test_info": educator_node}
+ASYNC_SPECIALISTS = {"diagnosis": adiagnostician_node, "medicine_info": apharmacist_node, "test_info": aeducator_node}
+
+# GRAPH 
 def route_logic(state: MedicalState):
+    # Combined and speculative routing may already have answered inside the router.
+    if state.get('structured_response'):
+        return "answered"
     return state['intent']
 
-workflow.add_conditional_edges("router", route_logic, 
-    {"diagnosis": "diagnostician", "medicine_info": "pharmacist", "test_info": "educator"})
-workflow.add_edge("diagnostician", END)
-workflow.add_edge("pharmacist", END)
-workflow.add_edge("educator", END)
+def build_graph():
+    from langgraph.graph import StateGraph, END
+    from langchain_core.runnables import RunnableLambda
+
+    workflow = StateGraph(MedicalState)
+    workflow.add_node("router", RunnableLambda(router_node, afunc=arouter_node))
+    workflow.add_node("diagnostician", RunnableLambda(diagnostician_node, afunc=adiagnostician_node))
+    workflow.add_node("pharmacist", RunnableLambda(pharmacist_node, afunc=apharmacist_node))
+    workflow.add_node("educator", RunnableLambda(educator_node, afunc=aeducator_node))
+
+    workflow.set_entry_point("router")
+
+    workflow.add_conditional_edges("router", route_logic, 
+        {"diagnosis": "diagnostician", "medicine_info": "pharmacist", "test_info": "educator", "answered": END})
+    workflow.add_edge("diagnostician", END)
+    workflow.add_edge("pharmacist", END)
+    workflow.add_edge("educator", END)
+
+    return workflow.compile()
+
+def get_app_graph():
+    """Returns the compiled graph, compiling it on first call."""
+    global _app_graph
+    if _app_graph is None:
+        with _build_lock:
+            if _app_graph is None:
+                _app_graph = build_graph()
+    return _app_graph
+
+def __getattr__(name):
+    # Keeps `from src.graph import app_graph` / `llm` working, built lazily.
+    if name == "app_graph":
+        return get_app_graph()
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# BATCH EXECUTION
+async def arun_case(case, timeout=120):
+    """Runs one case through app_graph; failures and timeouts come back as {"error": "..."}."""
+    try:
+        return await asyncio.wait_for(get_app_graph().ainvoke(case), timeout)
+    except asyncio.TimeoutError:
+        return {"error": f"Timed out after {timeout}s"}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+async def arun_batch(cases, max_concurrency=4, timeout=120):
+    """
+    Runs many MedicalState inputs through app_graph concurrently.
+    Results come back in input order; a failed or timed-out case yields {"error": "..."}.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_case(case):
+        async with semaphore:
+            return await arun_case(case, timeout)
+
+    return await asyncio.gather(*(run_case(case) for case in cases))
+
+def stream_case(case):
+    """
+    Runs one case with field-level streaming. Yields ("intent", intent) once routed,
+    ("field", (name, value)) as each answer field arrives, and finally ("result", state).
+    """
+    config = {"configurable": {"stream_fields": True}}
+    final = dict(case)
+    for mode, chunk in get_app_graph().stream(case, config=config, stream_mode=["updates", "custom"]):
+        if mode == "custom":
+            yield "field", (chunk["field"], chunk["value"])
+            continue
+        for update in chunk.values():
+            if not update:
+                continue
+            final.update(update)
+            if "intent" in update:
+                yield "intent", update["intent"]
+    yield "result", final
 
-app_graph = workflow.compile()
\ No newline at end of file
+def run_batch(cases, max_concurrency=4, timeout=120):
+    """Synchronous entry point for arun_batch (do not call from inside a running event loop)."""
+    return asyncio.run(arun_batch(cases, max_concurrency=max_concurrency, timeout=timeout))
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+from src.telemetry import metrics
+
+HISTORY_PATH = os.path.join("data", "knowledge_base", "case_history.sqlite3")
+
+logger = logging.getLogger(__name__)
+
+
+def _flatten(value):
+    """All text inside a structured response, for the search index."""
+    if isinstance(value, dict):
+        return " ".join(_flatten(v) for v in value.values())
+    if isinstance(value, list):
+        return " ".join(_flatten(v) for v in value)
+    return "" if value is None else str(value)
+
+
+def _title(intent, response, user_input):
+    for key in ("title", "name", "test_name"):
+        if response.get(key):
+            return str(response[key])
+    return " ".join(user_input.split())[:80] or intent or "Untitled case"
+
+
+def _match_query(text):
+    """Turns free text into an FTS5 query: every word must match, as a prefix."""
+    words = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class CaseHistory:
+    """
+    Local SQLite store of past cases (input + structured response) with an FTS5 index.
+    Writes go through a background thread so recording never blocks the caller.
+    """
+
+    def __init__(self, path=HISTORY_PATH, max_cases=None, retention_days=None, max_input_chars=None):
+        self.path = path
+        self.max_cases = max_cases or int(os.getenv("CRIS_HISTORY_MAX_CASES", "2000"))
+        self.retention_seconds = (retention_days or float(os.getenv("CRIS_HISTORY_DAYS", "90"))) * 86400
+        self.max_input_chars = max_input_chars or int(os.getenv("CRIS_HISTORY_MAX_INPUT_CHARS", "20000"))
+        self.fts = True
+        self._queue = queue.Queue(maxsize=256)
+        self._writer = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cases ("
+            "id INTEGER PRIMARY KEY, created REAL NOT NULL, input_type TEXT, intent TEXT, "
+            "title TEXT, user_input TEXT, response TEXT NOT NULL, search_text TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_created ON cases(created)")
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS cases_fts USING fts5("
+                "title, search_text, content='cases', content_rowid='id')"
+            )
+            conn.executescript(
+                "CREATE TRIGGER IF NOT EXISTS cases_ai AFTER INSERT ON cases BEGIN "
+                "INSERT INTO cases_fts(rowid, title, search_text) VALUES (new.id, new.title, new.search_text); END;"
+                "CREATE TRIGGER IF NOT EXISTS cases_ad AFTER DELETE ON cases BEGIN "
+                "INSERT INTO cases_fts(cases_fts, rowid, title, search_text) "
+                "VALUES ('delete', old.id, old.title, old.search_text); END;"
+            )
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5: fall back to LIKE queries.
+            logger.warning("FTS5 unavailable, case search falls back to LIKE: %s", e)
+            self.fts = False
+        conn.commit()
+        return conn
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    # Writing
+    def record(self, state, response):
+        """Queues a finished case for storage; returns immediately."""
+        if not response:
+            return
+        self._start_writer()
+        try:
+            self._queue.put_nowait((time.time(), dict(state), response))
+        except queue.Full:
+            metrics.inc("cris_history_dropped_total")
+            logger.warning("Case history queue full; case not recorded")
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_forever, name="cris-history-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_forever(self):
+        conn = self._connect()  # the writer owns its own connection
+        while True:
+            item = self._queue.get()
+            try:
+                self._insert(conn, *item)
+            except sqlite3.Error as e:
+                logger.warning("Case history write error: %s", e)
+            finally:
+                self._queue.task_done()
+
+    def _insert(self, conn, created, state, response):
+        intent = state.get("intent")
+        user_input = (state.get("user_input") or "")[:self.max_input_chars]
+        conn.execute(
+            "INSERT INTO cases (created, input_type, intent, title, user_input, response, search_text) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (created, state.get("input_type"), intent, _title(intent, response, user_input),
+             user_input, json.dumps(response), f"{user_input} {_flatten(response)}"),
+        )
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self._prune(conn, created)
+        conn.commit()
+        metrics.inc("cris_history_writes_total")
+
+    def _prune(self, conn, now):
+        """Drops cases past the retention window, then the oldest beyond max_cases."""
+        conn.execute("DELETE FROM cases WHERE created < ?", (now - self.retention_seconds,))
+        conn.execute(
+            "DELETE FROM cases WHERE id IN (SELECT id FROM cases ORDER BY id DESC LIMIT -1 OFFSET ?)",
+            (self.max_cases,),
+        )
+
+    def flush(self, timeout=5.0):
+        """Waits (up to timeout) for queued writes to reach the database."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    # Reading
+    def search(self, text="", limit=20):
+        """Most recent matching cases (all cases for an empty query), newest first."""
+        match = _match_query(text)
+        with self._lock:
+            try:
+                db = self._db()
+                if not match:
+                    rows = db.execute(
+                        "SELECT id, created, intent, title FROM cases ORDER BY id DESC LIMIT ?", (limit,)
+                    ).fetchall()
+                elif self.fts:
+                    rows = db.execute(
+                        "SELECT c.id, c.created, c.intent, c.title FROM cases_fts "
+                        "JOIN cases c ON c.id = cases_fts.rowid WHERE cases_fts MATCH ? "
+                        "ORDER BY c.id DESC LIMIT ?", (match, limit),
+                    ).fetchall()
+                else:
+                    rows = db.execute(
+                        "SELECT id, created, intent, title FROM cases WHERE search_text LIKE ? "
+                        "ORDER BY id DESC LIMIT ?", (f"%{text.strip()}%", limit),
+                    ).fetchall()
+            except sqlite3.Error as e:
+                logger.warning("Case history search error: %s", e)
+                return []
+        return [{"id": r[0], "created": r[1], "intent": r[2], "title": r[3]} for r in rows]
+
+    def get(self, case_id):
+        """The stored case as {"intent", "structured_response", "user_input", "created"}, or None."""
+        with self._lock:
+            try:
+                row = self._db().execute(
+                    "SELECT intent, response, user_input, created FROM cases WHERE id = ?", (case_id,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning("Case history read error: %s", e)
+                return None
+        if row is None:
+            return None
+        return {"intent": row[0], "structured_response": json.loads(row[1]), "user_input": row[2], "created": row[3]}
+
+
+case_history = CaseHistory()
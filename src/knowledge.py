@@ -0,0 +1,307 @@
+import os
+import re
+import csv
+import json
+import mmap
+import time
+import logging
+import threading
+from src.cache import normalize_query
+
+KNOWLEDGE_DIR = os.path.join("data", "knowledge_base")
+INDEX_DIRNAME = ".index"
+SOURCE_EXTENSIONS = (".json", ".csv", ".md")
+INDEX_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+MEDICINE_FIELDS = ("name", "brand_names", "uses", "mechanism", "dosage", "lifestyle_diet", "side_effects", "warnings")
+TEST_FIELDS = ("test_name", "purpose", "procedure", "preparation", "normal_range")
+LIST_FIELDS = {"uses", "side_effects", "synonyms"}
+
+# Markdown "## Heading" -> schema field.
+SECTION_ALIASES = {
+    "brand names": "brand_names", "brands": "brand_names",
+    "uses": "uses", "indications": "uses",
+    "mechanism": "mechanism", "mechanism of action": "mechanism",
+    "dosage": "dosage", "dosing": "dosage", "dosage administration": "dosage",
+    "lifestyle": "lifestyle_diet", "lifestyle diet": "lifestyle_diet", "diet": "lifestyle_diet",
+    "side effects": "side_effects", "adverse effects": "side_effects",
+    "warnings": "warnings", "contraindications": "warnings",
+    "purpose": "purpose", "indication": "purpose",
+    "procedure": "procedure", "preparation": "preparation",
+    "normal range": "normal_range", "reference range": "normal_range", "normal ranges": "normal_range",
+    "synonyms": "synonyms", "aliases": "synonyms",
+}
+
+# Longest name (in words) tried when scanning a query for known names.
+MAX_NAME_WORDS = 4
+# Queries longer than this are treated as real questions and left to the LLM.
+MAX_QUERY_WORDS = 8
+# Words a query may contain besides the drug/test name and still be a plain "tell me about X"
+# lookup. Anything else ("child", "overdose", "cirrhosis", a second drug) is a specific
+# question the generic monograph does not answer, so it goes to the cache/LLM.
+FILLER_WORDS = frozenset(
+    "a an the of for to on about and is are what whats tell me give show explain describe "
+    "please info information overview summary details drug medicine medication tablet tablets "
+    "use uses used does do how work works mechanism action brand brands names name "
+    "dose dosage dosing side effect effects warning warnings "
+    "test tests procedure scan exam purpose preparation prepare prep normal range ranges "
+    "reference results result level levels".split()
+)
+
+
+def _split_list(value):
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [part.strip() for part in re.split(r"[;\n]", str(value or "")) if part.strip()]
+
+
+def _normalize_record(raw, source):
+    """Coerces a raw monograph dict into a medicine/test record, or None if it is unusable."""
+    raw = {str(k).strip().lower().replace(" ", "_"): v for k, v in raw.items() if v not in (None, "")}
+    kind = str(raw.pop("type", "")).lower()
+    if kind in ("test", "procedure", "lab") or (not kind and "test_name" in raw):
+        kind, fields = "test", TEST_FIELDS
+    else:
+        kind, fields = "medicine", MEDICINE_FIELDS
+
+    record = {"type": kind, "source": source}
+    for field in fields + ("synonyms",):
+        if field in raw:
+            record[field] = _split_list(raw[field]) if field in LIST_FIELDS else str(raw[field]).strip()
+    if "aliases" in raw:
+        record.setdefault("synonyms", []).extend(_split_list(raw["aliases"]))
+    if not record.get("name" if kind == "medicine" else "test_name"):
+        return None
+    return record
+
+
+def _parse_markdown(text, source):
+    """One monograph per '# Title'; 'key: value' lines set metadata, '## Section' blocks set fields."""
+    records = []
+    current, section, buffer = None, None, []
+
+    def flush_section():
+        if current is not None and section:
+            field = SECTION_ALIASES.get(section, section.replace(" ", "_"))
+            items = [line[2:].strip() for line in buffer if line.startswith(("- ", "* "))]
+            current[field] = items if field in LIST_FIELDS and items else "\n".join(buffer).strip()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("# "):
+            flush_section()
+            if current is not None:
+                records.append(current)
+            current, section, buffer = {"title": stripped[2:].strip()}, None, []
+        elif stripped.startswith("## ") and current is not None:
+            flush_section()
+            section, buffer = normalize_query(stripped[3:]), []
+        elif current is not None and section is None and ":" in stripped:
+            key, value = stripped.split(":", 1)
+            current[key.strip().lower()] = value.strip()
+        elif current is not None and section is not None:
+            buffer.append(stripped)
+    flush_section()
+    if current is not None:
+        records.append(current)
+
+    parsed = []
+    for raw in records:
+        title = raw.pop("title")
+        is_test = str(raw.get("type", "")).lower() in ("test", "procedure", "lab")
+        raw.setdefault("test_name" if is_test else "name", title)
+        record = _normalize_record(raw, source)
+        if record:
+            parsed.append(record)
+    return parsed
+
+
+def parse_monograph_file(path):
+    """Returns the records in one JSON, CSV or Markdown source file."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+            rows = data if isinstance(data, list) else [data]
+        elif path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            return _parse_markdown(f.read(), path)
+    return [r for r in (_normalize_record(row, path) for row in rows if isinstance(row, dict)) if r]
+
+
+class _Snapshot:
+    """Read-only view over one on-disk index: names in memory, record bodies via mmap."""
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, "index.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.files = meta["files"]
+        self.records = meta["records"]
+        self.names = meta["names"]
+        self._blob_file = open(os.path.join(index_dir, "records.bin"), "rb")
+        size = os.fstat(self._blob_file.fileno()).st_size
+        self._blob = mmap.mmap(self._blob_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def record(self, record_id):
+        offset, length = self.records[record_id][:2]
+        return json.loads(self._blob[offset:offset + length])
+
+    def raw_record(self, record_id):
+        offset, length = self.records[record_id][:2]
+        return bytes(self._blob[offset:offset + length])
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._blob_file.close()
+
+
+class MonographIndex:
+    """
+    Name/synonym index over local drug and test monographs in data/knowledge_base.
+    Sources are re-parsed only when their mtime or size changes.
+    """
+
+    def __init__(self, source_dir=KNOWLEDGE_DIR, refresh_seconds=None):
+        self.source_dir = source_dir
+        self.index_dir = os.path.join(source_dir, INDEX_DIRNAME)
+        self.refresh_seconds = refresh_seconds or float(os.getenv("CRIS_KB_REFRESH_SECONDS", "60"))
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # Held while a snapshot is read or swapped out, so a retired snapshot is never read after close.
+        self._swap_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _scan_sources(self):
+        sources = {}
+        if not os.path.isdir(self.source_dir):
+            return sources
+        for root, dirs, files in os.walk(self.source_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if name.endswith(SOURCE_EXTENSIONS) and not name.startswith("."):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    sources[os.path.relpath(path, self.source_dir)] = [stat.st_mtime, stat.st_size]
+        return sources
+
+    def refresh(self, force=False):
+        """Rebuilds the on-disk index if any source file was added, changed or removed."""
+        with self._lock:
+            if self._snapshot is None and os.path.exists(os.path.join(self.index_dir, "index.json")):
+                try:
+                    self._snapshot = _Snapshot(self.index_dir)
+                except (OSError, ValueError, KeyError):
+                    self._snapshot = None
+
+            sources = self._scan_sources()
+            previous = self._snapshot
+            if previous is None and not sources:
+                self._checked_at = time.monotonic()
+                return False
+            unchanged = previous is not None and not force and {
+                path: entry[:2] for path, entry in previous.files.items()
+            } == sources
+            self._checked_at = time.monotonic()
+            if unchanged:
+                return False
+
+            snapshot = self._rebuild(sources, None if force else previous)
+            with self._swap_lock:
+                self._snapshot = snapshot
+                if previous is not None:
+                    previous.close()
+            return True
+
+    def _rebuild(self, sources, previous):
+        os.makedirs(self.index_dir, exist_ok=True)
+        blob_path = os.path.join(self.index_dir, "records.bin")
+        files, records, names = {}, [], {}
+        offset = 0
+
+        with open(blob_path + ".tmp", "wb") as blob:
+            for path, (mtime, size) in sorted(sources.items()):
+                old = previous.files.get(path) if previous else None
+                if old and old[:2] == [mtime, size]:
+                    # Unchanged source: copy its encoded records over without re-parsing.
+                    encoded = [previous.raw_record(rid) for rid in old[2]]
+                else:
+                    try:
+                        parsed = parse_monograph_file(os.path.join(self.source_dir, path))
+                    except (OSError, ValueError, csv.Error) as e:
+                        logger.warning("Skipping monograph source %s: %s", path, e)
+                        parsed = []
+                    encoded = [json.dumps(r, ensure_ascii=False).encode("utf-8") for r in parsed]
+
+                ids = []
+                for data in encoded:
+                    record = json.loads(data)
+                    record_id = len(records)
+                    blob.write(data)
+                    records.append([offset, len(data), record["type"]])
+                    offset += len(data)
+                    ids.append(record_id)
+                    primary = record.get("name") or record.get("test_name")
+                    aliases = [primary] + record.get("synonyms", [])
+                    if record["type"] == "medicine":
+                        aliases += re.split(r"[,;/]", record.get("brand_names", ""))
+                    for alias in aliases:
+                        key = normalize_query(alias)
+                        if key:
+                            names.setdefault(f"{record['type']}:{key}", record_id)
+                files[path] = [mtime, size, ids]
+
+        meta = {"version": INDEX_VERSION, "files": files, "records": records, "names": names}
+        with open(os.path.join(self.index_dir, "index.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(blob_path + ".tmp", blob_path)
+        os.replace(os.path.join(self.index_dir, "index.json.tmp"), os.path.join(self.index_dir, "index.json"))
+        return _Snapshot(self.index_dir)
+
+    def lookup(self, query, kind):
+        """
+        Returns the monograph fields when `query` names exactly one known drug/test of the
+        given kind ("medicine" or "test") and otherwise holds only FILLER_WORDS, else None.
+        """
+        if self._snapshot is None or time.monotonic() - self._checked_at > self.refresh_seconds:
+            self.refresh()
+        tokens = normalize_query(query).split()
+        with self._swap_lock:
+            snapshot = self._snapshot
+            if snapshot is None or not snapshot.names:
+                return None
+
+            matches, covered = set(), set()
+            if 0 < len(tokens) <= MAX_QUERY_WORDS:
+                for size in range(min(MAX_NAME_WORDS, len(tokens)), 0, -1):
+                    for start in range(len(tokens) - size + 1):
+                        record_id = snapshot.names.get(f"{kind}:{' '.join(tokens[start:start + size])}")
+                        if record_id is not None:
+                            matches.add(record_id)
+                            covered.update(range(start, start + size))
+            specific = any(i not in covered and token not in FILLER_WORDS for i, token in enumerate(tokens))
+
+            # Several different drugs/tests in one query (e.g. an interaction question) is not a lookup,
+            # nor is a question about one drug/test in a particular situation.
+            if len(matches) != 1 or specific:
+                self.misses += 1
+                return None
+            self.hits += 1
+            record = snapshot.record(matches.pop())
+        fields = MEDICINE_FIELDS if kind == "medicine" else TEST_FIELDS
+        return {field: record[field] for field in fields if field in record}
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "records": len(snapshot.records) if snapshot else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+monograph_index = MonographIndex()
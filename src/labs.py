@@ -0,0 +1,176 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# Fewer parsed rows than this is not treated as a lab report.
+LAB_MIN_ROWS = int(os.getenv("CRIS_LAB_MIN_ROWS", "3"))
+
+_UNIT = (
+    r"(?:x\s?)?10\^?\d+/[uµμ]?L|[KM]/[uµμ]L|(?:cells)?/[uµμ]L|"
+    r"m?[mµμunp]?(?:g|mol|Eq|IU|U)/(?:d|m|µ|μ|u)?L|[mµμu]?IU/m?L|"
+    r"mm/hr?|mL/min(?:/1\.73\s?m2)?|fL|pg|%|sec|s"
+)
+_NUMBER = r"\d+(?:\.\d+)?"
+LAB_LINE = re.compile(
+    rf"^\s*(?P<analyte>[A-Za-z][A-Za-z0-9 ,()/'.+-]{{0,38}}?[A-Za-z0-9)])\s*:?\s+"
+    rf"(?P<printed_flag>[HL](?=\s))?\s*(?P<qualifier>[<>])?\s*(?P<value>{_NUMBER})\s*(?P<value_flag>[HL]\b|\*)?\s*"
+    rf"(?P<unit>{_UNIT})?\s*"
+    rf"(?:\[|\()?\s*(?:(?P<low>{_NUMBER})\s*(?:-|–|to)\s*(?P<high>{_NUMBER})|(?P<cmp>[<>]=?)\s*(?P<limit>{_NUMBER}))?\s*(?:\]|\))?"
+    rf"\s*(?P<trailing_flag>[HL]|High|Low)?\s*$",
+    re.IGNORECASE,
+)
+
+UNIT_ALIASES = {
+    "mg/dl": "mg/dL", "g/dl": "g/dL", "g/l": "g/L", "mmol/l": "mmol/L", "nmol/l": "nmol/L", "pmol/l": "pmol/L",
+    "umol/l": "µmol/L", "μmol/l": "µmol/L", "µmol/l": "µmol/L", "meq/l": "mEq/L", "u/l": "U/L", "iu/l": "U/L",
+    "ng/ml": "ng/mL", "ng/dl": "ng/dL", "pg/ml": "pg/mL", "ug/dl": "µg/dL", "μg/dl": "µg/dL", "µg/dl": "µg/dL",
+    "miu/l": "mIU/L", "uiu/ml": "mIU/L", "μiu/ml": "mIU/L", "µiu/ml": "mIU/L",
+    "10^9/l": "10^9/L", "x10^9/l": "10^9/L", "x 10^9/l": "10^9/L", "109/l": "10^9/L", "k/ul": "10^9/L",
+    "k/µl": "10^9/L", "10^3/ul": "10^9/L", "10^3/µl": "10^9/L", "x10^3/ul": "10^9/L",
+    "10^12/l": "10^12/L", "x10^12/l": "10^12/L", "m/ul": "10^12/L", "m/µl": "10^12/L", "10^6/ul": "10^12/L",
+    "fl": "fL", "mm/hr": "mm/h", "mm/h": "mm/h", "sec": "s",
+}
+
+# SI -> conventional units, keyed by an analyte keyword found in the analyte name.
+CONVERSIONS = pd.DataFrame([
+    ("glucose", "mmol/L", "mg/dL", 18.016),
+    ("cholesterol", "mmol/L", "mg/dL", 38.67),
+    ("ldl", "mmol/L", "mg/dL", 38.67),
+    ("hdl", "mmol/L", "mg/dL", 38.67),
+    ("triglyceride", "mmol/L", "mg/dL", 88.57),
+    ("creatinine", "µmol/L", "mg/dL", 1 / 88.42),
+    # Urea and urea nitrogen (BUN) share mmol/L but not mg/dL: 1 mmol is 60.06 mg urea, 28.01 mg nitrogen.
+    ("urea nitrogen", "mmol/L", "mg/dL", 2.801),
+    ("bun", "mmol/L", "mg/dL", 2.801),
+    ("urea", "mmol/L", "mg/dL", 6.006),
+    ("bilirubin", "µmol/L", "mg/dL", 1 / 17.1),
+    ("calcium", "mmol/L", "mg/dL", 4.008),
+    ("hemoglobin", "g/L", "g/dL", 0.1),
+    ("haemoglobin", "g/L", "g/dL", 0.1),
+], columns=["keyword", "unit", "target_unit", "factor"])
+# Longest first, so "urea nitrogen" wins over "urea".
+_KEYWORD = "(" + "|".join(sorted(CONVERSIONS["keyword"], key=len, reverse=True)) + ")"
+
+
+def parse_labs(text):
+    """
+    Extracts analyte/value/unit/reference rows from report text in one vectorized pass.
+    Returns (DataFrame, narrative) where narrative is the text minus the parsed lab lines.
+    """
+    lines = pd.Series(text.splitlines(), dtype="object")
+    if lines.empty:
+        return _empty_frame(), text
+    fields = lines.str.extract(LAB_LINE)
+    # A number alone is not a lab row; require a recognised unit or a reference range.
+    is_lab = fields["value"].notna() & (fields["unit"].notna() | fields["low"].notna() | fields["limit"].notna())
+    labs = fields[is_lab].reset_index(drop=True)
+    narrative = "\n".join(lines[~is_lab])
+    if labs.empty:
+        return _empty_frame(), narrative
+
+    numbers = labs[["value", "low", "high", "limit"]].apply(pd.to_numeric, errors="coerce")
+    frame = pd.DataFrame({
+        "analyte": labs["analyte"].str.strip(),
+        "value": numbers["value"],
+        # "<0.01" is a detection limit, not the value 0.01; the sign is kept for display.
+        "qualifier": labs["qualifier"].fillna(""),
+        "unit": _normalize_units(labs["unit"]),
+        "low": numbers["low"],
+        "high": numbers["high"],
+        "cmp": labs["cmp"],
+        "limit": numbers["limit"],
+        "printed_flag": labs["printed_flag"].fillna(labs["value_flag"]).fillna(labs["trailing_flag"]),
+    })
+    frame = _convert_units(frame)
+    frame["flag"] = _flags(frame)
+    return frame, narrative
+
+
+def _empty_frame():
+    return pd.DataFrame(columns=["analyte", "value", "qualifier", "unit", "low", "high", "cmp", "limit", "printed_flag", "flag"])
+
+
+def _normalize_units(units):
+    spelled = units.str.replace("μ", "µ", regex=False).str.replace(" ", "", regex=False)
+    return spelled.str.lower().map(UNIT_ALIASES).fillna(spelled)
+
+
+def _convert_units(frame):
+    """Converts SI values (and their reference limits) to conventional units."""
+    keyword = frame["analyte"].str.lower().str.extract(_KEYWORD, expand=False)
+    lookup = pd.DataFrame({"keyword": keyword, "unit": frame["unit"]}).merge(
+        CONVERSIONS, on=["keyword", "unit"], how="left")
+    factor = lookup["factor"].fillna(1.0).to_numpy()
+    for column in ("value", "low", "high", "limit"):
+        frame[column] = (frame[column] * factor).round(2)
+    frame["unit"] = lookup["target_unit"].fillna(frame["unit"]).to_numpy()
+    return frame
+
+
+def _flags(frame):
+    value, low, high, limit = frame["value"], frame["low"], frame["high"], frame["limit"]
+    upper_limit = frame["cmp"].fillna("").str.startswith("<")
+    lower_limit = frame["cmp"].fillna("").str.startswith(">")
+    printed = frame["printed_flag"].fillna("").str[:1].str.upper()
+    has_reference = low.notna() | limit.notna()
+    printed_conditions, printed_flags = [printed == "H", printed == "L"], ["High", "Low"]
+    exact = np.select(
+        [value < low, value > high, upper_limit & (value >= limit), lower_limit & (value <= limit), has_reference]
+        + printed_conditions,
+        ["Low", "High", "High", "Low", "Normal"] + printed_flags,
+        default="",
+    )
+    # "<x" and ">x" only bound the result; flag them only where the whole bound falls on one side.
+    below = np.select(
+        [value <= low, (value <= high) & (low <= 0), upper_limit & (value <= limit)] + printed_conditions,
+        ["Low", "Normal", "Normal"] + printed_flags,
+        default="",
+    )
+    above = np.select(
+        [value >= high, lower_limit & (value >= limit)] + printed_conditions,
+        ["High", "Normal"] + printed_flags,
+        default="",
+    )
+    qualifier = frame["qualifier"]
+    return np.where(qualifier == "<", below, np.where(qualifier == ">", above, exact))
+
+
+def _value(row):
+    return f"{row.qualifier}{row.value:g}"
+
+
+def _reference(row):
+    if pd.notna(row.low):
+        return f"{row.low:g}-{row.high:g}"
+    if pd.notna(row.limit):
+        return f"{row.cmp}{row.limit:g}"
+    return ""
+
+
+def table_data(frame):
+    """Rows for DiagnosticOutput.table_data."""
+    return [
+        {"Analyte": row.analyte, "Value": _value(row), "Unit": row.unit if pd.notna(row.unit) else "",
+         "Reference": _reference(row), "Flag": row.flag}
+        for row in frame.itertuples(index=False)
+    ]
+
+
+def lab_context(frame):
+    """
+    Compact prompt text: one line per analyte/unit/reference with all its values,
+    abnormal ones marked, e.g. "Glucose (mg/dL, ref 70-99): 92, 250 H".
+    """
+    lines = []
+    rows = list(frame.itertuples(index=False))
+    frame = frame.assign(reference=[_reference(row) for row in rows], shown=[_value(row) for row in rows],
+                         unit=frame["unit"].fillna(""))
+    for (analyte, unit, reference), group in frame.groupby(["analyte", "unit", "reference"], sort=False):
+        values = ", ".join(
+            value + (f" {flag[0]}" if flag in ("High", "Low") else "")
+            for value, flag in zip(group["shown"], group["flag"])
+        )
+        detail = ", ".join(part for part in (unit, f"ref {reference}" if reference else "") if part)
+        lines.append(f"{analyte} ({detail}): {values}" if detail else f"{analyte}: {values}")
+    return "\n".join(lines)
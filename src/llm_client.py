@@ -0,0 +1,497 @@
+import os
+import math
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from src.telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+# Size these to the project's Gemini quota (requests per minute).
+RATE_PER_MINUTE = float(os.getenv("CRIS_LLM_RPM", "600"))
+BURST = int(os.getenv("CRIS_LLM_BURST", "20"))
+MAX_RETRIES = int(os.getenv("CRIS_LLM_MAX_RETRIES", "4"))
+BACKOFF_SECONDS = float(os.getenv("CRIS_LLM_BACKOFF_SECONDS", "0.5"))
+BACKOFF_MAX_SECONDS = 20.0
+BREAKER_FAILURES = int(os.getenv("CRIS_LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("CRIS_LLM_BREAKER_SECONDS", "30"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {"ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "ServerError"}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the model while the circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Model service unavailable after repeated failures; retry in {math.ceil(retry_after)}s.")
+
+
+def is_retryable(error):
+    """Quota, overload, server and network errors (checked along the exception's cause chain)."""
+    while error is not None:
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        if getattr(error, "code", None) in RETRYABLE_STATUS or getattr(error, "status_code", None) in RETRYABLE_STATUS:
+            return True
+        if type(error).__name__ in RETRYABLE_NAMES:
+            return True
+        error = error.__cause__
+    return False
+
+
+class TokenBucket:
+    """Rate limiter; reserve() hands out tokens in arrival order and returns how long to wait."""
+
+    def __init__(self, rate_per_second, burst):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        if self.rate <= 0:
+            return 0.0  # unlimited
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive retryable errors and rejects calls for
+    `reset_seconds`; then lets a single trial call through (half-open).
+    """
+
+    STATES = {"closed": 0, "open": 1, "half_open": 2}
+
+    def __init__(self, failures, reset_seconds):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        metrics.set_gauge("cris_llm_circuit_state", self.STATES[state])
+
+    def check(self):
+        with self._lock:
+            if self.state == "open":
+                remaining = self.opened_at + self.reset_seconds - time.monotonic()
+                if remaining > 0:
+                    metrics.inc("cris_llm_rejected_total")
+                    raise CircuitOpenError(remaining)
+                self._set_state("half_open")
+            if self.state == "half_open":
+                # A trial that never reported back (e.g. cancelled) stops blocking after reset_seconds.
+                now = time.monotonic()
+                if self._trial_started is not None and now - self._trial_started < self.reset_seconds:
+                    metrics.inc("cris_llm_rejected_total")
+                    raise CircuitOpenError(self.reset_seconds)
+                self._trial_started = now
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive = 0
+            self._trial_started = None
+            if self.state != "closed":
+                logger.info("Model circuit closed")
+                self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive += 1
+            self._trial_started = None
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                logger.warning("Model circuit opened after %s consecutive failures", self.consecutive)
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _StreamFlight:
+    """
+    One upstream stream shared by concurrent identical requests. Each caller replays the
+    buffered chunks and then pulls the next one itself, one caller at a time, so the stream
+    keeps going as long as anyone is still reading it.
+    """
+
+    def __init__(self, upstream, on_finish):
+        self.upstream = upstream
+        self.on_finish = on_finish
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.consumers = 0
+        self.lock = threading.Lock()
+
+    def replay(self):
+        position = 0
+        while True:
+            if position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+                continue
+            with self.lock:
+                if position < len(self.chunks):
+                    continue
+                if self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                try:
+                    self.chunks.append(next(self.upstream))
+                except StopIteration:
+                    self._finish()
+                except BaseException as e:
+                    self.error = e
+                    self._finish()
+
+    def _finish(self):
+        self.finished = True
+        self.on_finish(self)
+
+    def close(self):
+        """Stops the upstream call once every caller has gone."""
+        with self.lock:
+            if not self.finished:
+                self.upstream.close()
+                self._finish()
+
+
+class _AsyncStreamFlight:
+    """Async counterpart of _StreamFlight; the upstream is drained by its own task, so one
+    caller being cancelled (e.g. a dropped speculative call) does not cut off the others."""
+
+    def __init__(self, upstream, on_finish):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.consumers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self._produce(upstream, on_finish))
+
+    async def _produce(self, upstream, on_finish):
+        try:
+            async for chunk in upstream:
+                self.chunks.append(chunk)
+                self._notify()
+        except BaseException as e:  # including cancellation once every caller has gone
+            self.error = e
+        finally:
+            self.finished = True
+            on_finish(self)
+            self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def replay(self):
+        position = 0
+        while True:
+            if position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            elif self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+    def close(self):
+        if not self.finished:
+            self.task.cancel()
+
+
+def _payload_key(*parts):
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+class ResilientLLM:
+    """
+    Wraps the shared chat model with single-flight coalescing of identical in-flight
+    requests, a token-bucket rate limit, jittered exponential backoff on retryable
+    errors and a circuit breaker. Exposes the subset of the chat model API the graph uses.
+    """
+
+    def __init__(self, llm, rate_per_minute=None, burst=None, max_retries=None,
+                 breaker_failures=None, breaker_reset_seconds=None):
+        self.llm = llm
+        self.model = getattr(llm, "model", None)
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.limiter = TokenBucket((rate_per_minute or RATE_PER_MINUTE) / 60, burst or BURST)
+        self.breaker = CircuitBreaker(breaker_failures or BREAKER_FAILURES, breaker_reset_seconds or BREAKER_RESET_SECONDS)
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._aflights = {}
+        self._streams = {}
+        self._waiting = 0
+
+    # Admission: breaker first (fail fast), then the rate limiter.
+    def _reserve(self):
+        self.breaker.check()
+        wait = self.limiter.reserve()
+        metrics.observe("cris_llm_queue_wait_seconds", wait)
+        return wait
+
+    def _queue(self, delta):
+        with self._lock:
+            self._waiting += delta
+            metrics.set_gauge("cris_llm_queue_depth", self._waiting)
+
+    def _admit(self):
+        wait = self._reserve()
+        if wait:
+            self._queue(1)
+            try:
+                time.sleep(wait)
+            finally:
+                self._queue(-1)
+
+    async def _aadmit(self):
+        wait = self._reserve()
+        if wait:
+            self._queue(1)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._queue(-1)
+
+    def _retry_delay(self, error, attempt):
+        """Backoff before the next attempt, or None when the error should propagate."""
+        if not is_retryable(error):
+            self.breaker.record_success()  # the service answered; the request itself was bad
+            return None
+        self.breaker.record_failure()
+        if attempt >= self.max_retries or self.breaker.state == "open":
+            return None
+        metrics.inc("cris_llm_retries_total", error=type(error).__name__)
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_SECONDS * 2 ** attempt))
+        logger.warning("Retryable model error (%s), attempt %s, backing off %.2fs", error, attempt + 1, delay)
+        return delay
+
+    def call(self, fn):
+        """Runs fn() under the rate limit, retry policy and circuit breaker."""
+        attempt = 0
+        while True:
+            self._admit()
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn):
+        attempt = 0
+        while True:
+            await self._aadmit()
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def coalesce(self, key, fn):
+        """Single-flight: concurrent callers with the same key share one execution of fn()."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            metrics.inc("cris_llm_coalesced_total")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def acoalesce(self, key, fn):
+        loop = asyncio.get_running_loop()
+        key = (id(loop), key)  # futures belong to one event loop
+        while True:
+            with self._lock:
+                future = self._aflights.get(key)
+                leader = future is None
+                if leader:
+                    future = self._aflights[key] = loop.create_future()
+            if leader:
+                break
+            metrics.inc("cris_llm_coalesced_total")
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader was cancelled (e.g. a dropped speculative call); take over unless we were too.
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved; followers re-raise it themselves
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._aflights.pop(key, None)
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        return _ResilientStructured(self, self.llm.with_structured_output(schema, include_raw=include_raw, **kwargs),
+                                    (schema.__name__, include_raw))
+
+    def invoke(self, payload, config=None, **kwargs):
+        key = _payload_key("invoke", payload)
+        return self.coalesce(key, lambda: self.call(lambda: self.llm.invoke(payload, config=config, **kwargs)))
+
+    async def ainvoke(self, payload, config=None, **kwargs):
+        key = _payload_key("invoke", payload)
+        return await self.acoalesce(key, lambda: self.acall(lambda: self.llm.ainvoke(payload, config=config, **kwargs)))
+
+    def _join_stream(self, key, start):
+        """The in-flight stream for key, started with start(on_finish) if there is none."""
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is None:
+                flight = self._streams[key] = start(lambda done: self._end_stream(key, done))
+            else:
+                metrics.inc("cris_llm_coalesced_total")
+            flight.consumers += 1
+        return flight
+
+    def _end_stream(self, key, flight):
+        with self._lock:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    def _leave_stream(self, key, flight):
+        with self._lock:
+            flight.consumers -= 1
+            abandoned = flight.consumers == 0
+            if abandoned and self._streams.get(key) is flight:
+                del self._streams[key]
+        if abandoned:
+            flight.close()
+
+    def stream(self, payload, config=None, **kwargs):
+        """Single-flight like invoke: identical concurrent streams share one upstream call."""
+        key = _payload_key("stream", payload)
+        flight = self._join_stream(key, lambda on_finish: _StreamFlight(self._stream(payload, config, kwargs), on_finish))
+        try:
+            yield from flight.replay()
+        finally:
+            self._leave_stream(key, flight)
+
+    async def astream(self, payload, config=None, **kwargs):
+        key = (id(asyncio.get_running_loop()), _payload_key("stream", payload))
+        flight = self._join_stream(
+            key, lambda on_finish: _AsyncStreamFlight(self._astream(payload, config, kwargs), on_finish))
+        try:
+            async for chunk in flight.replay():
+                yield chunk
+        finally:
+            self._leave_stream(key, flight)
+
+    def _stream(self, payload, config, kwargs):
+        """A failure is retried only before the first chunk arrives."""
+        attempt = 0
+        while True:
+            self._admit()
+            started = False
+            try:
+                for chunk in self.llm.stream(payload, config=config, **kwargs):
+                    if not started:
+                        started = True
+                        self.breaker.record_success()
+                    yield chunk
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return
+
+    async def _astream(self, payload, config, kwargs):
+        attempt = 0
+        while True:
+            await self._aadmit()
+            started = False
+            try:
+                async for chunk in self.llm.astream(payload, config=config, **kwargs):
+                    if not started:
+                        started = True
+                        self.breaker.record_success()
+                    yield chunk
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return
+
+
+class _ResilientStructured:
+    def __init__(self, client, runnable, key_prefix):
+        self.client = client
+        self.runnable = runnable
+        self.key_prefix = key_prefix
+
+    def invoke(self, payload, config=None, **kwargs):
+        key = _payload_key(self.key_prefix, payload)
+        return self.client.coalesce(key, lambda: self.client.call(lambda: self.runnable.invoke(payload, config=config, **kwargs)))
+
+    async def ainvoke(self, payload, config=None, **kwargs):
+        key = _payload_key(self.key_prefix, payload)
+        return await self.client.acoalesce(key, lambda: self.client.acall(lambda: self.runnable.ainvoke(payload, config=config, **kwargs)))
@@ -0,0 +1,172 @@
+import io
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from src.bench_graph import build_fixtures, percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(args):
+    """Starts src.server against the fake LLM in a scratch directory; returns (process, base_url)."""
+    port = free_port()
+    env = dict(os.environ, CRIS_LLM_BACKEND="fake", CRIS_FAKE_LATENCY_MS=str(args.latency_ms),
+               CRIS_LLM_RPM=str(args.rpm), GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "unused"),
+               PYTHONPATH=REPO_ROOT + os.pathsep + os.getenv("PYTHONPATH", ""))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "src.server", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--queue", str(args.queue)],
+        cwd=tempfile.mkdtemp(prefix="cris-load-"), env=env,
+        stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(client, base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base_url}/healthz")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+def make_payloads():
+    image, pdf = build_fixtures()
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return {"pdf": pdf, "image": buffer.getvalue()}
+
+
+async def send(client, base_url, kind, index, fixtures, mode, honor_retry_after=False):
+    """
+    Sends one case; returns (status_code, seconds, retries). Async mode polls the job until
+    it finishes; with honor_retry_after a 429 is retried after the advertised delay.
+    """
+    if kind == "text":
+        # Unique text so response caches never short-circuit the measured path.
+        request = {"json": {"text": f"Case {index}: 54 y/o with fever, productive cough and chest pain."}}
+    else:
+        request = {"content": fixtures[kind],
+                   "headers": {"Content-Type": "application/pdf" if kind == "pdf" else "image/jpeg"}}
+    started = time.perf_counter()
+    retries = 0
+    while True:
+        response = await client.post(f"{base_url}/v1/analyze", params={"mode": mode}, **request)
+        if response.status_code != 429 or not honor_retry_after:
+            break
+        retries += 1
+        await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+    if response.status_code == 202:
+        status_url = response.json()["status_url"]
+        while True:
+            await asyncio.sleep(0.05)
+            response = await client.get(status_url)
+            if response.status_code != 200 or response.json()["status"] == "done":
+                break
+    return response.status_code, time.perf_counter() - started, retries
+
+
+async def run(args, base_url):
+    import httpx
+
+    fixtures = make_payloads()
+    kinds = args.mix.split(",")
+    semaphore = asyncio.Semaphore(args.concurrency)
+    statuses = Counter()
+    latencies = []
+    retried = 0
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        await wait_ready(client, base_url)
+
+        async def one(index):
+            nonlocal retried
+            async with semaphore:
+                try:
+                    status, seconds, retries = await send(client, base_url, kinds[index % len(kinds)], index,
+                                                          fixtures, args.mode, args.honor_retry_after)
+                    retried += retries
+                except httpx.HTTPError as e:
+                    status, seconds = type(e).__name__, None
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(seconds)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        server_metrics = (await client.get(f"{base_url}/metrics")).text
+
+    latencies.sort()
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "mode": args.mode,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "retries_after_429": retried,
+        "ok_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "server_queue_waits": [line for line in server_metrics.splitlines()
+                               if line.startswith("cris_server_queue_seconds_sum")
+                               or line.startswith("cris_server_queue_seconds_count")],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for src.server. Without --url it starts one on the fake LLM.")
+    parser.add_argument("--url", help="Base URL of a running server (default: spawn one with the fake backend)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--mix", default="text,text,pdf,image", help="Comma-separated payload kinds, used round-robin")
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync", help="Wait on the request or poll the job")
+    parser.add_argument("--honor-retry-after", action="store_true", help="Retry 429 responses after Retry-After")
+    parser.add_argument("--timeout", type=float, default=300, help="Client timeout per request")
+    parser.add_argument("--workers", type=int, default=8, help="Spawned server: concurrent cases")
+    parser.add_argument("--queue", type=int, default=64, help="Spawned server: queue size")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Spawned server: fake LLM latency")
+    parser.add_argument("--rpm", type=float, default=0, help="Spawned server: CRIS_LLM_RPM (0 = unlimited)")
+    parser.add_argument("-o", "--output", help="Write the report as JSON to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the spawned server's log")
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.url
+    if base_url is None:
+        process, base_url = spawn_server(args)
+    try:
+        report = asyncio.run(run(args, base_url.rstrip("/")))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    print(f"{report['requests']} requests, concurrency {report['concurrency']} ({report['mode']}): "
+          f"{report['ok_per_sec']} ok/s  p50 {report['p50_ms']} ms  p95 {report['p95_ms']} ms  p99 {report['p99_ms']} ms")
+    print("status codes:", ", ".join(f"{k}: {v}" for k, v in sorted(report["statuses"].items())),
+          f"(429 retries: {report['retries_after_429']})")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import os
+import re
+import json
+import time
+import heapq
+import logging
+import threading
+from itertools import islice
+import numpy as np
+from src.cache import normalize_query
+from src.telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("CRIS_SEMANTIC_CACHE", "on") != "off"
+DIM = int(os.getenv("CRIS_SEMANTIC_DIM", "256"))
+MAX_ENTRIES = int(os.getenv("CRIS_SEMANTIC_MAX_ENTRIES", "20000"))
+TTL_SECONDS = float(os.getenv("CRIS_CACHE_TTL_HOURS", "168")) * 3600
+
+# Cosine similarity needed to reuse an answer. On top of it a cached query must have exactly
+# the query's content words: rewording may only add, drop or move stop and filler words, since
+# one swapped word (kidney/liver, warfarin/insulin) still scores above any similarity threshold.
+THRESHOLDS = {
+    "medicine_info": float(os.getenv("CRIS_SEMANTIC_THRESHOLD_MEDICINE", "0.90")),
+    "test_info": float(os.getenv("CRIS_SEMANTIC_THRESHOLD_TEST", "0.90")),
+    "diagnosis": float(os.getenv("CRIS_SEMANTIC_THRESHOLD_DIAGNOSIS", "0.98")),
+}
+# Intents whose cached query must have the same content words in the same order, with no
+# filler words dropped: in a case note "left arm ... right leg" is not "right arm ... left leg".
+EXACT_INTENTS = frozenset({"diagnosis"})
+
+# Each entry is indexed under the SKETCH_SIZE smallest hashes of its words (a bottom-k MinHash
+# sketch); a lookup scores only entries sharing one of the query's PROBE_TERMS rarest sketch words.
+SKETCH_SIZE = 16
+PROBE_TERMS = 4
+MAX_CANDIDATES = 512
+# The best TOP_K by vector cosine are re-checked on their exact words, since hashed
+# vectors collide and the maximum over many candidates finds those collisions.
+TOP_K = 8
+TRIGRAM_WEIGHT = 0.5
+LOOKUP_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+STOP_WORDS = frozenset(
+    "a an the is are was were be what whats which who how why when can could should would do does did "
+    "i im me my we our you your it its this that these those of for to in on at by with about and or "
+    "tell explain please give info information".split()
+)
+# Words a reference question can gain or lose without asking something else.
+FILLER_WORDS = frozenset(
+    "drug drugs medicine medicines medication medications tablet tablets pill pills "
+    "know need want some any more details detail overview summary describe define definition "
+    "mean meaning means used use uses usual common main general basic".split()
+)
+SUFFIXES = ("ations", "ation", "ings", "ing", "ions", "ion", "ed", "es", "s", "e")
+# Words that must occur identically in two case write-ups for them to share an answer.
+NEGATIONS = frozenset("no not denies denied without negative absent never none".split())
+_NUMBER = re.compile(r"\d")
+
+
+def _stem(word):
+    """Crude suffix stripping so "uses"/"used" and "prepare"/"preparation" share a feature."""
+    if _NUMBER.search(word):
+        return word
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            return word[:-len(suffix)]
+    return word
+
+
+def _words(text):
+    return [word for word in normalize_query(text).split() if word not in STOP_WORDS]
+
+
+def _guard(words):
+    """Hash of the numbers and negations in a text; entries only match when it is equal."""
+    return hash(tuple(sorted(word for word in words if word in NEGATIONS or _NUMBER.search(word))))
+
+
+def _hashes(features):
+    # Python's string hash is salted per process, which is fine for an in-process index.
+    return np.fromiter((hash(feature) for feature in features), dtype=np.int64, count=len(features))
+
+
+def embed(words, dim=DIM):
+    """
+    Signed hashing vectorizer over words and their character trigrams, L2-normalized.
+    Each word's trigrams share a fixed weight, so long words do not outweigh short names.
+    """
+    grams, weights = [], [1.0] * len(words)
+    for padded in (f"<{word}>" for word in words):
+        count = len(padded) - 2
+        grams += [padded[i:i + 3] for i in range(count)]
+        weights += [TRIGRAM_WEIGHT / count] * count
+    hashes = np.concatenate([_hashes(words), _hashes(grams)])
+    weights = np.array(weights)
+    signs = np.where(hashes & (1 << 40), 1.0, -1.0)
+    vector = np.bincount(hashes % dim, weights=weights * signs, minlength=dim).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Index:
+    """Fixed-capacity ring of embeddings for one intent; the oldest entry is overwritten first."""
+
+    def __init__(self, dim, capacity):
+        self.capacity = capacity
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.created = np.zeros(capacity)
+        self.guards = np.zeros(capacity, dtype=np.int64)
+        self.sequences = np.zeros(capacity, dtype=np.int64)
+        self.values = [None] * capacity
+        self.terms = [frozenset()] * capacity
+        self.sketches = [()] * capacity
+        self.postings = {}  # word hash -> {slot: None}, insertion-ordered
+        self.next_slot = 0
+        self.size = 0
+
+    def add(self, vector, terms, sketch, guard, sequence, value, now):
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.capacity
+        if self.values[slot] is not None:
+            self._unlink(slot)
+        else:
+            self.size += 1
+        self.vectors[slot] = vector
+        self.created[slot] = now
+        self.guards[slot] = guard
+        self.sequences[slot] = sequence
+        self.values[slot] = value
+        self.terms[slot] = terms
+        self.sketches[slot] = sketch
+        for term in sketch:
+            self.postings.setdefault(term, {})[slot] = None
+
+    def _unlink(self, slot):
+        for term in self.sketches[slot]:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(slot, None)
+                if not posting:
+                    del self.postings[term]
+
+    def candidates(self, sketch):
+        """Slots sharing the query's rarest sketch words, newest first, at most MAX_CANDIDATES."""
+        postings = [p for p in (self.postings.get(term) for term in sketch) if p]
+        slots = {}
+        for posting in heapq.nsmallest(PROBE_TERMS, postings, key=len):
+            slots.update(dict.fromkeys(islice(reversed(posting), MAX_CANDIDATES - len(slots))))
+            if len(slots) >= MAX_CANDIDATES:
+                break
+        return np.fromiter(slots, dtype=np.int64, count=len(slots))
+
+
+class SemanticCache:
+    """
+    Near-duplicate answer cache: queries are embedded locally (no model call) and an answer
+    is reused when a cached query of the same intent is similar enough and differs from it
+    only in stop and filler words (and, outside EXACT_INTENTS, word order). In-process only;
+    exact repeats are still served by the persistent response cache.
+    """
+
+    def __init__(self, dim=None, max_entries=None, thresholds=None, ttl_seconds=None):
+        self.dim = dim or DIM
+        self.max_entries = max_entries or MAX_ENTRIES
+        self.thresholds = {**THRESHOLDS, **(thresholds or {})}
+        self.ttl_seconds = ttl_seconds or TTL_SECONDS
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+
+    def _prepare(self, intent, text):
+        words = _words(text)
+        if intent not in EXACT_INTENTS:
+            words = [word for word in words if word not in FILLER_WORDS]
+        if not words:
+            return None
+        stems = [_stem(word) for word in words]
+        terms = frozenset(hash(stem) for stem in stems)
+        sketch = tuple(heapq.nsmallest(SKETCH_SIZE, terms))
+        return embed(stems, self.dim), terms, sketch, _guard(words), hash(tuple(stems))
+
+    def lookup(self, namespace, intent, text):
+        """Returns (answer, similarity) for the closest cached query above the intent's threshold, or None."""
+        if intent not in self.thresholds:
+            return None
+        started = time.perf_counter()
+        prepared = self._prepare(intent, text)
+        match = None
+        if prepared is not None:
+            with self._lock:
+                index = self._indexes.get(namespace)
+                if index is not None:
+                    match = self._best(index, *prepared, self.thresholds[intent], intent in EXACT_INTENTS)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.lookup_seconds += elapsed
+            if match:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.observe("cris_semantic_lookup_seconds", elapsed, buckets=LOOKUP_BUCKETS, intent=intent)
+        metrics.inc("cris_semantic_cache_total", intent=intent, outcome="hit" if match else "miss")
+        return match
+
+    def _best(self, index, vector, terms, sketch, guard, sequence, threshold, in_order):
+        slots = index.candidates(sketch)
+        if not len(slots):
+            return None
+        # Different numbers (doses, vitals, lab values) or negations never share an answer.
+        slots = slots[(index.guards[slots] == guard) & (index.created[slots] > time.time() - self.ttl_seconds)]
+        if not len(slots):
+            return None
+        scores = index.vectors[slots] @ vector
+        top = np.flatnonzero(scores >= threshold)
+        for position in top[np.argsort(-scores[top])][:TOP_K]:
+            slot = slots[position]
+            if index.terms[slot] != terms or (in_order and index.sequences[slot] != sequence):
+                continue
+            return json.loads(index.values[slot]), float(scores[position])
+        return None
+
+    def add(self, namespace, intent, text, answer):
+        if intent not in self.thresholds:
+            return
+        prepared = self._prepare(intent, text)
+        if prepared is None:
+            return
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None:
+                index = self._indexes[namespace] = _Index(self.dim, self.max_entries)
+            index.add(*prepared, json.dumps(answer), time.time())
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "avg_lookup_ms": 1000 * self.lookup_seconds / total if total else 0.0,
+                "entries": sum(index.size for index in self._indexes.values()),
+            }
+
+
+semantic_cache = SemanticCache()
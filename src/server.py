@@ -0,0 +1,304 @@
+import io
+import os
+import json
+import math
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from src.telemetry import metrics, span
+from src.utils import setup_logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("CRIS_SERVER_WORKERS", "8"))
+QUEUE_SIZE = int(os.getenv("CRIS_SERVER_QUEUE", "64"))
+CASE_TIMEOUT = float(os.getenv("CRIS_SERVER_TIMEOUT", "120"))
+JOB_TTL_SECONDS = float(os.getenv("CRIS_JOB_TTL_SECONDS", "600"))
+MAX_UPLOAD_BYTES = int(float(os.getenv("CRIS_SERVER_MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+
+IMAGE_TYPES = {"image/png", "image/jpeg", "image/jpg"}
+
+
+class JobError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, kind, payload):
+        self.id = uuid.uuid4().hex
+        self.kind = kind  # "text", "pdf" or "image"
+        self.payload = payload
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.unread_pages = []  # scanned PDF pages the vision model will not see
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = asyncio.get_running_loop().create_future()
+
+    def to_dict(self):
+        body = {"job_id": self.id, "status": self.status}
+        if self.started:
+            body["queued_seconds"] = round(self.started - self.created, 3)
+        if self.finished:
+            body["run_seconds"] = round(self.finished - self.started, 3)
+        if self.unread_pages:
+            body["unread_pages"] = self.unread_pages
+        if self.result is not None:
+            body["intent"] = self.result.get("intent")
+            body["structured_response"] = self.result.get("structured_response")
+        if self.error is not None:
+            body["error"] = str(self.error)
+        return body
+
+
+def _prepare_case(kind, payload):
+    """
+    Turns a request payload into (MedicalState input, unread PDF page numbers); runs in a
+    worker thread.
+    """
+    from src.tools import FileTools
+
+    if kind == "text":
+        return {"user_input": payload, "input_type": "text", "image_data": None}, []
+    if kind == "pdf":
+        # Large PDFs fan out over the shared, bounded extraction pool (CRIS_PDF_WORKERS).
+        content = FileTools.extract_pdf(io.BytesIO(payload))
+        unread = list(content.unread_pages)
+        if content.error:
+            if unread:
+                raise JobError(422, f"{content.error} Unreadable scanned page(s): {', '.join(map(str, unread))}.")
+            raise JobError(422, content.error)
+        # Scanned pages go to the vision model alongside the text pages.
+        case = {"user_input": content.text, "input_type": "file", "image_data": content.page_images or None}
+        return case, unread
+    image = FileTools.process_image(io.BytesIO(payload))
+    if image is None:
+        raise JobError(422, "Could not read the image.")
+    return {"user_input": "", "input_type": "file", "image_data": image}, []
+
+
+class InferenceService:
+    """Bounded job queue drained by a fixed pool of async workers running app_graph."""
+
+    def __init__(self, workers=None, queue_size=None, timeout=None):
+        self.workers = workers or WORKERS
+        self.queue_size = queue_size or QUEUE_SIZE
+        self.timeout = timeout or CASE_TIMEOUT
+        self.queue = None
+        self.jobs = {}
+        self.avg_seconds = 1.0  # moving average of case run time, for Retry-After
+        self._tasks = []
+
+    async def start(self):
+        from src.graph import get_app_graph
+
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        await asyncio.to_thread(get_app_graph)  # compile before taking traffic
+        self._tasks = [asyncio.create_task(self._work(), name=f"cris-worker-{i}") for i in range(self.workers)]
+        logger.info("Inference service: %s workers, queue of %s", self.workers, self.queue_size)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up."""
+        backlog = self.queue.qsize() + self.workers
+        return max(1, min(60, math.ceil(backlog * self.avg_seconds / self.workers)))
+
+    def submit(self, kind, payload):
+        self._expire_jobs()
+        job = Job(kind, payload)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.inc("cris_server_rejected_total", reason="queue_full")
+            raise JobError(429, "Server busy; retry later.", retry_after=self.retry_after())
+        self.jobs[job.id] = job
+        metrics.set_gauge("cris_server_queue_depth", self.queue.qsize())
+        return job
+
+    def _expire_jobs(self):
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+            del self.jobs[job_id]
+
+    async def _work(self):
+        from src.graph import get_app_graph
+        from src.llm_client import CircuitOpenError
+
+        while True:
+            job = await self.queue.get()
+            metrics.set_gauge("cris_server_queue_depth", self.queue.qsize())
+            job.status = "running"
+            job.started = time.time()
+            metrics.observe("cris_server_queue_seconds", job.started - job.created)
+            try:
+                with span("server.case", kind=job.kind):
+                    case, job.unread_pages = await asyncio.to_thread(_prepare_case, job.kind, job.payload)
+                    job.payload = None  # release the upload
+                    job.result = await asyncio.wait_for(get_app_graph().ainvoke(case), self.timeout)
+                job.status = "done"
+            except asyncio.TimeoutError:
+                job.status, job.error = "error", JobError(504, f"Timed out after {self.timeout:.0f}s")
+            except CircuitOpenError as e:
+                job.status, job.error = "error", JobError(503, str(e), retry_after=math.ceil(e.retry_after))
+            except JobError as e:
+                job.status, job.error = "error", e
+            except Exception as e:
+                logger.exception("Job %s failed", job.id)
+                job.status, job.error = "error", JobError(500, f"{type(e).__name__}: {e}")
+            finally:
+                job.finished = time.time()
+                self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (job.finished - job.started)
+                metrics.inc("cris_server_jobs_total", status=job.status)
+                if not job.done.done():
+                    job.done.set_result(None)
+                self.queue.task_done()
+
+
+service = InferenceService()
+
+
+def _job_response(job, status=200):
+    if job.status == "error":
+        status = job.error.status
+    response = JSONResponse(job.to_dict(), status_code=status)
+    if job.status == "error" and job.error.retry_after:
+        response.headers["Retry-After"] = str(job.error.retry_after)
+    return response
+
+
+def _error_response(error):
+    response = JSONResponse({"error": str(error)}, status_code=error.status)
+    if error.retry_after:
+        response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def _too_large():
+    return JobError(413, f"Payload larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+
+
+async def _read_body(request):
+    """Reads the body in chunks, stopping at MAX_UPLOAD_BYTES (chunked uploads send no content-length)."""
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise _too_large()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def _read_payload(request):
+    """Accepts JSON {"text": ...} or a raw PDF/PNG/JPEG body."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if int(request.headers.get("content-length") or 0) > MAX_UPLOAD_BYTES:
+        raise _too_large()
+    if content_type == "application/json":
+        try:
+            body = json.loads(await _read_body(request))
+        except ValueError:
+            raise JobError(400, "Body is not valid JSON.")
+        text = body.get("text") if isinstance(body, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            raise JobError(400, 'Expected {"text": "<clinical notes or query>"}.')
+        return "text", text
+    if content_type == "application/pdf" or content_type in IMAGE_TYPES:
+        data = await _read_body(request)
+        if not data:
+            raise JobError(400, "Empty upload.")
+        return ("pdf" if content_type == "application/pdf" else "image"), data
+    raise JobError(415, "Send application/json, application/pdf, image/png or image/jpeg.")
+
+
+async def analyze(request):
+    """POST /v1/analyze[?mode=async]: runs one case. Sync mode waits for the result, async returns a job id."""
+    try:
+        kind, payload = await _read_payload(request)
+        job = service.submit(kind, payload)
+    except JobError as e:
+        return _error_response(e)
+
+    status_url = str(request.url_for("job_status", job_id=job.id))
+    if request.query_params.get("mode") == "async":
+        return JSONResponse({"job_id": job.id, "status": job.status, "status_url": status_url},
+                            status_code=202, headers={"Location": status_url})
+    try:
+        await asyncio.wait_for(asyncio.shield(job.done), service.timeout * 2)
+    except asyncio.TimeoutError:
+        # Still queued or running: hand back the job so the caller can poll.
+        return JSONResponse({"job_id": job.id, "status": job.status, "status_url": status_url},
+                            status_code=202, headers={"Location": status_url})
+    return _job_response(job)
+
+
+async def job_status(request):
+    """GET /v1/jobs/{job_id}"""
+    job = service.jobs.get(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "Unknown or expired job."}, status_code=404)
+    return _job_response(job)
+
+
+async def health(request):
+    return JSONResponse({"status": "ok", "workers": service.workers,
+                         "queue_depth": service.queue.qsize(), "queue_size": service.queue_size})
+
+
+async def prometheus(request):
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await service.start()
+    yield
+    await service.stop()
+
+
+app = Starlette(
+    routes=[
+        Route("/v1/analyze", analyze, methods=["POST"]),
+        Route("/v1/jobs/{job_id}", job_status, methods=["GET"], name="job_status"),
+        Route("/healthz", health, methods=["GET"]),
+        Route("/metrics", prometheus, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless HTTP service for the clinical analysis graph.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Concurrent cases")
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE, help="Queued cases before answering 429")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    setup_logging()
+    service.workers = args.workers
+    service.queue_size = args.queue
+    uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import json
+
+
+def json_instructions(schema):
+    """Prompt suffix asking the model for a bare JSON object, fields in schema order."""
+    fields = ", ".join(schema.model_fields)
+    return (
+        "\n\nRespond ONLY with a single JSON object (no markdown fences) whose keys appear "
+        f"in exactly this order: {fields}.\n"
+        f"JSON schema:\n{json.dumps(schema.model_json_schema())}"
+    )
+
+
+def chunk_text(chunk):
+    """Text content of a streamed message chunk (string or list-of-parts content)."""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, list):
+        return "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+    return content or ""
+
+
+class PartialJSONParser:
+    """
+    Incrementally scans a streamed JSON object and reports each top-level field
+    as soon as its value is complete, so the UI can render it before the rest arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._key = None
+        self._value_start = None
+        self._started = False
+
+    def feed(self, text):
+        """Adds streamed text; returns a list of (key, value) pairs completed by it."""
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if not self._started:
+                # Skip any preamble such as a ```json fence.
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        self._key = json.loads(buffer[self._string_start:i + 1])
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1:
+                    self._finish_value(buffer, i, completed)
+                self._depth -= 1
+            elif self._depth == 1:
+                if char == ":" and self._key is not None:
+                    self._value_start = i + 1
+                elif char == ",":
+                    self._finish_value(buffer, i, completed)
+        self._pos = len(buffer)
+        return completed
+
+    def _finish_value(self, buffer, end, completed):
+        if self._key is None or self._value_start is None:
+            return
+        raw = buffer[self._value_start:end].strip()
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = None
+        else:
+            self.fields[self._key] = value
+            completed.append((self._key, value))
+        self._key = None
+        self._value_start = None
+
+    @property
+    def complete(self):
+        return self._started and self._depth == 0
@@ -0,0 +1,239 @@
+import os
+import time
+import bisect
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger("cris.telemetry")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 2e7, 1e8)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimates a quantile by linear interpolation inside the matching bucket."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= target and bucket_count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (target - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Process-wide counters, gauges and histograms, keyed by name and label set."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render_prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({n for n, _ in series}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (n, labels), value in sorted(series.items()):
+                        if n == name:
+                            lines.append(f"{name}{fmt(labels)} {value}")
+            for name in sorted({n for n, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), hist in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{fmt(labels)} {hist.sum}")
+                    lines.append(f"{name}_count{fmt(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def span_summary(self):
+        """Per-span rows (count, mean/p50/p95 latency) for the admin panel."""
+        with self._lock:
+            rows = []
+            for (name, labels), hist in sorted(self.histograms.items()):
+                if name != "cris_span_duration_seconds":
+                    continue
+                rows.append({
+                    "span": dict(labels).get("span"),
+                    "count": hist.count,
+                    "mean_ms": round(hist.sum / hist.count * 1000, 1) if hist.count else 0.0,
+                    "p50_ms": round(hist.quantile(0.5) * 1000, 1),
+                    "p95_ms": round(hist.quantile(0.95) * 1000, 1),
+                })
+            return rows
+
+    def counter_totals(self, name):
+        with self._lock:
+            return {labels: value for (n, labels), value in self.counters.items() if n == name}
+
+
+metrics = MetricsRegistry()
+_current_span = contextvars.ContextVar("cris_current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times a block and records it under cris_span_duration_seconds{span=name}.
+    Recognised attributes: payload_bytes, prompt_tokens, response_tokens, cache_hit.
+    """
+    current = Span(name, dict(attributes))
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        metrics.inc("cris_span_errors_total", span=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _current_span.reset(token)
+        _record(current, elapsed)
+
+
+def _record(current, elapsed):
+    attrs = current.attributes
+    metrics.observe("cris_span_duration_seconds", elapsed, span=current.name)
+    if attrs.get("payload_bytes") is not None:
+        metrics.observe("cris_span_payload_bytes", attrs["payload_bytes"], buckets=BYTES_BUCKETS, span=current.name)
+    for kind in ("prompt", "response"):
+        if attrs.get(f"{kind}_tokens"):
+            metrics.inc("cris_llm_tokens_total", attrs[f"{kind}_tokens"], span=current.name, kind=kind)
+    if attrs.get("cache_hit"):
+        metrics.inc("cris_cache_hits_total", span=current.name, cache=attrs["cache_hit"])
+    logger.info("%s %.1f ms %s", current.name, elapsed * 1000, attrs or "")
+
+
+def annotate(**attributes):
+    """Adds attributes to the innermost active span (no-op outside a span)."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def traced(name):
+    """Decorator form of span() for plain and async functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_exporters(port=None, path=None, interval=15.0):
+    """
+    Starts (once per process) a Prometheus text endpoint on CRIS_METRICS_PORT and/or
+    a periodic dump to CRIS_METRICS_FILE. Safe to call on every Streamlit rerun.
+    """
+    global _exporters_started
+    port = port or os.getenv("CRIS_METRICS_PORT")
+    path = path or os.getenv("CRIS_METRICS_FILE")
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    if port:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", int(port)), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="cris-metrics-http", daemon=True).start()
+        logger.info("Serving metrics on :%s", port)
+
+    if path:
+        def write_forever():
+            while True:
+                tmp = f"{path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(metrics.render_prometheus())
+                os.replace(tmp, path)
+                time.sleep(interval)
+
+        threading.Thread(target=write_forever, name="cris-metrics-file", daemon=True).start()
+        logger.info("Writing metrics to %s every %ss", path, interval)
@@ -1,40 +1,481 @@
+import io
+import os
+import time
+import base64
+import shutil
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+import logging
+from typing import NamedTuple
 import PyPDF2
-from PIL import Image
-import kagglehub
+from PIL import Image, ImageChops
+from src.telemetry import metrics, span
+
+# PDFs with at least this many pages are extracted across the shared process pool,
+# which every caller (app sessions, server workers) shares, so total fan-out stays bounded.
+PARALLEL_PAGE_THRESHOLD = int(os.getenv("CRIS_PDF_PARALLEL_PAGES", "40"))
+PDF_WORKERS = int(os.getenv("CRIS_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+SLOW_PAGE_SECONDS = 2.0
+# Separates pages in extracted text so later stages can split on page boundaries.
+PAGE_BREAK = "\f"
+# Pages with less extractable text than this are treated as scanned and read by the vision model.
+SCANNED_PAGE_CHARS = int(os.getenv("CRIS_SCANNED_PAGE_CHARS", "20"))
+SCAN_PARALLEL_PAGES = 4
+
+logger = logging.getLogger(__name__)
+
+# Vision payload settings. Gemini gains little from edges beyond ~2k pixels.
+IMAGE_MAX_EDGE = int(os.getenv("CRIS_IMAGE_MAX_EDGE", "2048"))
+IMAGE_QUALITY = int(os.getenv("CRIS_IMAGE_QUALITY", "85"))
+IMAGE_GRAYSCALE = os.getenv("CRIS_IMAGE_GRAYSCALE", "auto")  # "auto" or "off"
+IMAGE_CACHE_SIZE = 32
+
+# Multi-image studies: frames within this many dHash bits of a kept frame are dropped,
+# and the rest are sent in batches bounded by encoded size and image count.
+FRAME_DUP_DISTANCE = int(os.getenv("CRIS_FRAME_DUP_DISTANCE", "3"))
+VISION_BATCH_BYTES = int(os.getenv("CRIS_VISION_BATCH_BYTES", "6000000"))
+VISION_BATCH_IMAGES = int(os.getenv("CRIS_VISION_BATCH_IMAGES", "16"))
+
+
+class PageText(NamedTuple):
+    number: int
+    text: str
+    seconds: float
+
+
+class ImagePayload(NamedTuple):
+    data: str
+    mime_type: str
+    bytes_before: int
+    bytes_after: int
+    encode_seconds: float
+    content_hash: str
+
+    @property
+    def data_url(self):
+        return f"data:{self.mime_type};base64,{self.data}"
+
+
+class PdfContent(NamedTuple):
+    text: str
+    page_images: list  # ImagePayloads for scanned pages, in page order
+    scanned_pages: list
+    error: str = None
+    unread_pages: tuple = ()  # scanned pages that gave no usable image (e.g. JBIG2 or vector-only)
+
+
+_payload_cache = OrderedDict()
+_payload_lock = threading.Lock()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_worker_reader = (None, None)
+
+
+def _extraction_pool():
+    """The shared, bounded PDF extraction pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        # A worker that died (e.g. killed for memory) breaks the executor for good; start a new one.
+        if _pool is None or getattr(_pool, "_broken", False):
+            # Spawned, not forked: callers include multi-threaded servers.
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+@contextmanager
+def _pooled_document(pdf_file):
+    """
+    Yields a (path, mtime, size) key for the PDF, so pool workers read the file themselves
+    instead of receiving its bytes. Uploads are spooled to a temp file. Afterwards every
+    worker is asked to drop its reader for the document.
+    """
+    temporary = None
+    if isinstance(pdf_file, (str, os.PathLike)):
+        path = os.fspath(pdf_file)
+    else:
+        fd, path = temporary = tempfile.mkstemp(prefix="cris-", suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            pdf_file.seek(0)
+            shutil.copyfileobj(pdf_file, f)
+    try:
+        stat = os.stat(path)
+        document = (path, stat.st_mtime_ns, stat.st_size)
+        try:
+            yield document
+        finally:
+            pool = _extraction_pool()
+            for _ in range(PDF_WORKERS):
+                pool.submit(_drop_reader, document)
+    finally:
+        if temporary:
+            os.unlink(path)
+
+
+def _pool_map(fn, args, window):
+    """
+    Runs fn(*arg) on the shared pool with at most `window` tasks in flight and yields the
+    results in order. Tasks not yet started are cancelled if the caller stops early.
+    """
+    pool = _extraction_pool()
+    remaining = iter(args)
+    pending = deque(pool.submit(fn, *arg) for arg in islice(remaining, window))
+    try:
+        while pending:
+            result = pending.popleft().result()
+            for arg in islice(remaining, 1):
+                pending.append(pool.submit(fn, *arg))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _reader(document):
+    """Worker side: a PdfReader for a (path, mtime, size) document, parsed once per document per worker."""
+    global _worker_reader
+    if _worker_reader[0] != document:
+        _worker_reader = (None, None)  # release the previous document before reading the next
+        _worker_reader = (document, PyPDF2.PdfReader(document[0]))
+    return _worker_reader[1]
+
+
+def _drop_reader(document):
+    """Worker entry point: forgets the cached reader (and the file bytes it holds) for a finished document."""
+    global _worker_reader
+    if _worker_reader[0] == document:
+        _worker_reader = (None, None)
+
+
+def _extract_page_range(document, start, stop):
+    """Worker entry point: extracts pages [start, stop) of a document."""
+    reader = _reader(document)
+    pages = []
+    for index in range(start, stop):
+        began = time.perf_counter()
+        content = reader.pages[index].extract_text() or ""
+        pages.append(PageText(index + 1, content, time.perf_counter() - began))
+    return pages
+
+
+def _page_payloads(reader, number):
+    """Decodes the images embedded in one scanned page and encodes them for the vision call."""
+    payloads = []
+    try:
+        embedded = reader.pages[number - 1].images
+        for item in embedded:
+            image = Image.open(io.BytesIO(item.data))
+            if min(image.size) < 32:
+                continue  # bullets, logos and other page furniture
+            image.info["content_hash"] = hashlib.sha256(item.data).hexdigest()
+            image.info["source_bytes"] = len(item.data)
+            payloads.append(FileTools.prepare_image_payload(image))
+    except Exception as e:
+        logger.warning("Could not read images on PDF page %s: %s", number, e)
+    return payloads
+
+
+def _numbered(number, payloads):
+    if not payloads:
+        yield number, None
+    for payload in payloads:
+        yield number, payload
+
+
+def _scan_page(document, number):
+    """Worker entry point: (page number, ImagePayloads) for one page of a document."""
+    return number, _page_payloads(_reader(document), number)
+
+
+def _to_8bit(image):
+    """
+    Stretches 16-bit and float single-channel images (DICOM exports, TIFFs) from their
+    min/max range onto 0-255 as mode L; a plain convert("L") clips them to white.
+    """
+    if image.mode not in ("I", "I;16", "I;16B", "I;16L", "F"):
+        return image
+    wide = image.convert("F")
+    low, high = wide.getextrema()
+    scale = 255.0 / (high - low) if high > low else 0.0
+    return wide.point(lambda value: (value - low) * scale).convert("L")
+
+
+def _is_grayscale(image):
+    """True for single-channel images and RGB images whose channels are (near) identical."""
+    if image.mode in ("L", "I", "I;16", "I;16B", "I;16L", "F"):
+        return True
+    if image.mode != "RGB":
+        return False
+    r, g, b = image.resize((64, 64)).split()
+    return max(
+        ImageChops.difference(r, g).getextrema()[1],
+        ImageChops.difference(g, b).getextrema()[1],
+    ) <= 8
+
+
+def dhash(image, size=8):
+    """64-bit difference hash: which neighbouring pixels get brighter on a (size+1) x size thumbnail."""
+    small = _to_8bit(image.resize((size + 1, size), Image.Resampling.BOX)).convert("L")
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            value = (value << 1) | (left > pixels[row * (size + 1) + col + 1])
+    return value
+
+
+def _hash_file(image_file):
+    digest = hashlib.sha256()
+    if isinstance(image_file, (str, os.PathLike)):
+        with open(image_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest(), os.path.getsize(image_file)
+    image_file.seek(0)
+    size = 0
+    for chunk in iter(lambda: image_file.read(1 << 20), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    image_file.seek(0)
+    return digest.hexdigest(), size
+
 
 class FileTools:
     @staticmethod
-    def extract_text_from_pdf(pdf_file):
+    def iter_pdf_pages(pdf_file, page_range=None, workers=None):
+        """
+        Yields PageText(number, text, seconds) for each page, in order.
+        page_range is a 1-based inclusive (first, last) tuple. Large documents are split
+        into page batches across the shared process pool unless workers=1.
+        """
+        reader = PyPDF2.PdfReader(pdf_file)
+        page_count = len(reader.pages)
+        start, stop = 0, page_count
+        if page_range:
+            start = max(page_range[0] - 1, 0)
+            stop = min(page_range[1], page_count)
+
+        if workers is None:
+            workers = PDF_WORKERS if stop - start >= PARALLEL_PAGE_THRESHOLD else 1
+
+        if workers <= 1:
+            for index in range(start, stop):
+                began = time.perf_counter()
+                content = reader.pages[index].extract_text() or ""
+                yield PageText(index + 1, content, time.perf_counter() - began)
+            return
+
+        batch_size = max(1, -(-(stop - start) // (workers * 4)))
+        with _pooled_document(pdf_file) as document:
+            batches = ((document, s, min(s + batch_size, stop)) for s in range(start, stop, batch_size))
+            # Callers may stop early (e.g. max_chars); batches nobody will read are cancelled.
+            for pages in _pool_map(_extract_page_range, batches, workers * 2):
+                yield from pages
+
+    @staticmethod
+    def _read_text_pages(pdf_file, page_range, max_chars, workers):
+        """Returns (text of pages with a text layer, numbers of pages without one, pages read)."""
+        parts, scanned = [], []
+        total = 0
+        pages = 0
+        for page in FileTools.iter_pdf_pages(pdf_file, page_range, workers):
+            pages += 1
+            if page.seconds > SLOW_PAGE_SECONDS:
+                logger.warning("Slow PDF page %s: %.2fs", page.number, page.seconds)
+            if len(page.text.strip()) < SCANNED_PAGE_CHARS:
+                scanned.append(page.number)
+            if not page.text:
+                continue
+            parts.append(page.text)
+            total += len(page.text) + 2
+            if max_chars and total >= max_chars:
+                break
+        text = ("\n" + PAGE_BREAK).join(parts) + "\n" if parts else ""
+        if max_chars:
+            text = text[:max_chars]
+        return text, scanned, pages
+
+    @staticmethod
+    def extract_text_from_pdf(pdf_file, page_range=None, max_chars=None, workers=None):
         """Reads a PDF file object and returns all text."""
-        try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                content = page.extract_text()
-                if content:
-                    text += content + "\n"
-            return text if text.strip() else "Error: PDF appears empty or scanned."
-        except Exception as e:
-            return f"Error reading PDF: {str(e)}"
+        with span("tools.extract_pdf") as pdf_span:
+            try:
+                text, _, pages = FileTools._read_text_pages(pdf_file, page_range, max_chars, workers)
+                pdf_span.set(pages=pages, payload_bytes=len(text))
+                return text if text.strip() else "Error: PDF appears empty or scanned."
+            except Exception as e:
+                return f"Error reading PDF: {str(e)}"
+
+    @staticmethod
+    def extract_pdf(pdf_file, page_range=None, max_chars=None, workers=None):
+        """
+        Reads a PDF page by page: text from pages with a text layer, and vision payloads
+        for scanned (image-only) pages. Returns PdfContent; error is set instead of raising.
+        """
+        with span("tools.extract_pdf") as pdf_span:
+            try:
+                text, scanned, pages = FileTools._read_text_pages(pdf_file, page_range, max_chars, workers)
+                page_images, unread = [], []
+                for number, payload in FileTools.iter_scanned_pages(pdf_file, scanned, workers):
+                    if payload is None:
+                        unread.append(number)
+                    else:
+                        page_images.append(payload)
+            except Exception as e:
+                return PdfContent("", [], [], f"Error reading PDF: {str(e)}")
+            metrics.inc("cris_pdf_scanned_pages_total", len(scanned))
+            metrics.inc("cris_pdf_unread_pages_total", len(unread))
+            pdf_span.set(pages=pages, scanned_pages=len(scanned), unread_pages=len(unread), payload_bytes=len(text))
+            if unread:
+                logger.warning("No readable image on scanned PDF page(s) %s", ", ".join(map(str, unread)))
+            if not text.strip() and not page_images:
+                return PdfContent("", [], scanned, "Error: PDF has no readable text or page images.", tuple(unread))
+            return PdfContent(text, page_images, scanned, None, tuple(unread))
+
+    @staticmethod
+    def iter_scanned_pages(pdf_file, numbers, workers=None):
+        """
+        Yields (page number, ImagePayload) for the images embedded in the given pages, in order,
+        and (page number, None) for a page that gave no usable image.
+        Pages are decoded and encoded in the shared process pool with only a few in flight,
+        so a long scan never sits fully decoded in memory.
+        """
+        numbers = list(numbers)
+        if not numbers:
+            return
+        if workers is None:
+            workers = PDF_WORKERS if len(numbers) >= SCAN_PARALLEL_PAGES else 1
+
+        if workers <= 1:
+            reader = PyPDF2.PdfReader(pdf_file)
+            for number in numbers:
+                yield from _numbered(number, _page_payloads(reader, number))
+            return
+
+        with _pooled_document(pdf_file) as document:
+            for number, payloads in _pool_map(_scan_page, ((document, n) for n in numbers), workers * 2):
+                yield from _numbered(number, payloads)
 
     @staticmethod
     def process_image(image_file):
         """Validates and prepares an image for the model."""
-        try:
-            image = Image.open(image_file)
-            if image.mode == 'RGBA':
-                image = image.convert('RGB')
-            return image
-        except Exception as e:
-            print(f"Image processing error: {e}")
-            return None
+        with span("tools.process_image") as image_span:
+            try:
+                content_hash, size = _hash_file(image_file)
+                image_span.set(payload_bytes=size)
+                image = Image.open(image_file)
+                if image.mode == 'RGBA':
+                    image = image.convert('RGB')
+                # Carried along so encoded payloads can be cached by content.
+                image.info["content_hash"] = content_hash
+                image.info["source_bytes"] = size
+                return image
+            except Exception as e:
+                logger.warning("Image processing error: %s", e)
+                return None
+
+    @staticmethod
+    def prepare_image_payload(image, max_edge=None, quality=None, grayscale=None):
+        """
+        Downscales and JPEG-encodes an image for the vision call in a single pass.
+        Results are cached by source content hash, so re-sending the same image is free.
+        """
+        with span("tools.encode_image") as encode_span:
+            max_edge = max_edge or IMAGE_MAX_EDGE
+            quality = quality or IMAGE_QUALITY
+            grayscale = grayscale or IMAGE_GRAYSCALE
+
+            content_hash = image.info.get("content_hash")
+            cache_key = (content_hash, max_edge, quality, grayscale)
+            if content_hash:
+                with _payload_lock:
+                    cached = _payload_cache.get(cache_key)
+                    if cached:
+                        _payload_cache.move_to_end(cache_key)
+                        encode_span.set(cache_hit="image_payload", payload_bytes=cached.bytes_after)
+                        return cached
+
+            began = time.perf_counter()
+            bytes_before = image.info.get("source_bytes") or image.width * image.height * len(image.getbands())
+
+            prepared = _to_8bit(image)
+            if max(image.size) > max_edge:
+                scale = max_edge / max(image.size)
+                size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+                prepared = prepared.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            if grayscale == "auto" and _is_grayscale(prepared):
+                if prepared.mode != "L":
+                    prepared = prepared.convert("L")
+            elif prepared.mode not in ("RGB", "L"):
+                prepared = prepared.convert("RGB")
+
+            buffered = io.BytesIO()
+            prepared.save(buffered, format="JPEG", quality=quality)
+            payload = ImagePayload(
+                data=base64.b64encode(buffered.getbuffer()).decode("ascii"),
+                mime_type="image/jpeg",
+                bytes_before=bytes_before,
+                bytes_after=buffered.tell(),
+                encode_seconds=time.perf_counter() - began,
+                content_hash=content_hash or "",
+            )
+
+            encode_span.set(payload_bytes=payload.bytes_after, bytes_before=bytes_before)
+            if content_hash:
+                with _payload_lock:
+                    _payload_cache[cache_key] = payload
+                    while len(_payload_cache) > IMAGE_CACHE_SIZE:
+                        _payload_cache.popitem(last=False)
+            return payload
+
+    @staticmethod
+    def dedupe_frames(images, max_distance=None):
+        """
+        Drops near-duplicate frames (e.g. adjacent slices of a series) by perceptual hash.
+        Returns (kept images, dropped count, dropped source bytes).
+        """
+        max_distance = FRAME_DUP_DISTANCE if max_distance is None else max_distance
+        kept, hashes = [], []
+        dropped = dropped_bytes = 0
+        for image in images:
+            value = dhash(image)
+            if any(bin(value ^ other).count("1") <= max_distance for other in hashes):
+                dropped += 1
+                dropped_bytes += image.info.get("source_bytes") or 0
+                continue
+            kept.append(image)
+            hashes.append(value)
+        return kept, dropped, dropped_bytes
+
+    @staticmethod
+    def batch_payloads(payloads, max_bytes=None, max_images=None):
+        """Groups encoded images, in order, into batches within the per-request payload budget."""
+        max_bytes = max_bytes or VISION_BATCH_BYTES
+        max_images = max_images or VISION_BATCH_IMAGES
+        batches, current, size = [], [], 0
+        for payload in payloads:
+            if current and (size + len(payload.data) > max_bytes or len(current) >= max_images):
+                batches.append(current)
+                current, size = [], 0
+            current.append(payload)
+            size += len(payload.data)
+        if current:
+            batches.append(current)
+        return batches
 
 class DataTools:
     @staticmethod
     def fetch_kaggle_dataset(dataset_name):
         """
         Downloads a large dataset via API.
-        NOTE: Currently set to lazy-load to optimize app startup time.
         """
         try:
             print(f"Fetching dataset metadata: {dataset_name}...")
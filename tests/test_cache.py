@@ -0,0 +1,83 @@
+import types
+
+import pytest
+
+from src import cache
+from src.cache import ResponseCache, normalize_query
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+def make_cache(tmp_path, **kwargs):
+    return ResponseCache(path=str(tmp_path / "cache.sqlite3"), **kwargs)
+
+
+def test_normalize_query_ignores_case_punctuation_and_spacing():
+    assert normalize_query("  What is METFORMIN?? ") == normalize_query("what is metformin")
+
+
+def test_round_trip_through_both_tiers(tmp_path, clock):
+    first = make_cache(tmp_path)
+    first.set("k", {"name": "Metformin"})
+    assert first.get("k") == {"name": "Metformin"}
+    # A new instance has an empty memory tier and reads SQLite.
+    assert make_cache(tmp_path).get("k") == {"name": "Metformin"}
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    responses = make_cache(tmp_path, ttl_seconds=60)
+    responses.set("k", {"a": 1})
+    clock.now += 59
+    assert responses.get("k") == {"a": 1}
+    clock.now += 2
+    assert responses.get("k") is None
+    assert make_cache(tmp_path, ttl_seconds=60).get("k") is None
+    assert responses.stats()["misses"] == 1
+
+
+def test_size_eviction_keeps_entries_hot_in_memory(tmp_path, clock):
+    responses = make_cache(tmp_path, max_entries=10, memory_entries=500)
+    responses.set("hot", {"hot": True})
+    for i in range(60):
+        clock.now += 1
+        responses.set(f"cold-{i}", {"i": i})
+        assert responses.get("hot") == {"hot": True}  # served from memory every time
+
+    rows = responses._db().execute("SELECT key FROM responses").fetchall()
+    keys = {key for (key,) in rows}
+    assert "hot" in keys
+    assert "cold-0" not in keys
+    assert len(keys) == 10 + 11  # trimmed to max_entries on the 50th write
+
+
+def test_memory_hits_are_written_back_in_batches(tmp_path, clock):
+    responses = make_cache(tmp_path)
+    responses.set("k", {"a": 1})
+    responses.get("k")  # first hit writes back and starts the interval
+    accessed = lambda: responses._db().execute("SELECT accessed FROM responses WHERE key = 'k'").fetchone()[0]
+    clock.now += 10
+    responses.get("k")
+    assert accessed() == 1_000_000.0  # not written per hit
+    clock.now += cache.TOUCH_SECONDS
+    responses.get("k")
+    assert accessed() == 1_000_000.0 + 10 + cache.TOUCH_SECONDS
+
+    for i in range(cache.TOUCH_BATCH):
+        responses.set(f"other-{i}", {"i": i})
+    clock.now += 1
+    for i in range(cache.TOUCH_BATCH):
+        responses.get(f"other-{i}")
+    assert responses._db().execute("SELECT MIN(accessed) FROM responses WHERE key LIKE 'other-%'").fetchone()[0] == clock.now
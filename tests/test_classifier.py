@@ -0,0 +1,65 @@
+import pytest
+
+from src.classifier import IntentClassifier
+
+
+@pytest.fixture
+def classifier():
+    return IntentClassifier(threshold=0.8)
+
+
+@pytest.mark.parametrize("query, intent", [
+    # Pure drug questions.
+    ("metformin dosage", "medicine_info"),
+    ("what are the side effects of lisinopril", "medicine_info"),
+    ("atorvastatin", "medicine_info"),
+    ("zorbatinib side effects", "medicine_info"),  # unknown name, recognised by its suffix
+    # Pure test questions.
+    ("how to prepare for a colonoscopy", "test_info"),
+    ("hba1c normal range", "test_info"),
+    ("what does a tsh test measure", "test_info"),
+    # Symptoms and case notes.
+    ("54 y/o patient presents with fever and cough", "diagnosis"),
+    ("chest pain and shortness of breath since yesterday", "diagnosis"),
+    ("Patient 62 years old with a history of hypertension presents with crushing chest pain radiating "
+     "to the left arm, sweating and nausea for two hours, on amlodipine", "diagnosis"),
+])
+def test_clear_queries_are_routed_locally(classifier, query, intent):
+    assert classifier.route(query) == intent
+
+
+@pytest.mark.parametrize("query", [
+    # A drug next to a symptom could be a side-effect question or a case: the LLM decides.
+    "headache after taking ibuprofen",
+    "can warfarin cause bleeding",
+    "patient on metformin with abdominal pain and vomiting",
+    "mri for back pain",
+    "explain the results",
+    "hello there",
+])
+def test_mixed_or_vague_queries_fall_back_to_the_llm(classifier, query):
+    assert classifier.route(query) is None
+
+
+def test_clinical_notes_never_route_to_the_pharmacist(classifier):
+    notes = "Pt on lisinopril and atorvastatin presents with dizziness, syncope and palpitations since this morning"
+    assert classifier.route(notes) in ("diagnosis", None)
+
+
+def test_suffix_heuristic_needs_a_long_token(classifier):
+    assert classifier.classify("vir")[0] is None
+    assert classifier.classify("acyclovirx")[0] is None
+    assert classifier.classify("tenofovir")[0] == "medicine_info"
+
+
+def test_confidence_is_bounded_and_empty_text_has_no_intent(classifier):
+    assert classifier.classify("") == (None, 0.0)
+    for query in ("metformin dosage", "mri for back pain", "headache after taking ibuprofen"):
+        intent, confidence = classifier.classify(query)
+        assert intent is not None and 0.0 < confidence <= 1.0
+
+
+def test_stats_count_local_hits_and_fallbacks(classifier):
+    classifier.route("metformin dosage")
+    classifier.route("headache after taking ibuprofen")
+    assert classifier.stats() == {"local_hits": 1, "llm_fallbacks": 1, "hit_rate": 0.5}
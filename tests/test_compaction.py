@@ -0,0 +1,68 @@
+from src.compaction import compact
+from src.tools import PAGE_BREAK
+
+HEADER = "St. Mary's Hospital - Department of Medicine\nPatient: DOE, JANE  MRN 0012345"
+FOOTER = "CONFIDENTIAL NOTICE: this report is intended only for the named recipient.\nPage {} of {}"
+
+
+def document(bodies):
+    pages = [f"{HEADER}\n{body}\n{FOOTER.format(i + 1, len(bodies))}" for i, body in enumerate(bodies)]
+    return ("\n" + PAGE_BREAK).join(pages)
+
+
+def test_clinical_sentences_with_disclaimer_words_are_kept():
+    notes = [
+        "Confidential: patient disclosed history of abuse, intended to self-harm",
+        "Patient is a confidential informant; disclosure of HIV status refused",
+        "Sample labelled for clinical use only by the ward nurse, recollected",
+    ]
+    for note in notes:
+        assert compact(note).text == note
+    assert compact("\n".join(notes)).text == "\n".join(notes)
+
+
+def test_disclaimer_inside_a_page_body_is_kept():
+    body = "Day {}\nConfidential: patient disclosed history of abuse, intended to self-harm\nPlan: psychiatry review\nReview tomorrow"
+    text = compact(document([body.format(i) for i in range(3)])).text
+    assert text.count("Confidential: patient disclosed") == 3
+
+
+def test_repeated_clinical_lines_on_two_pages_are_kept():
+    text = compact("BP 150/90 mmHg on arrival\nPatient denies chest pain\n" + PAGE_BREAK
+                   + "BP 150/90 mmHg on arrival\nPatient denies chest pain\n").text
+    assert text.count("BP 150/90 mmHg on arrival") == 2
+    assert text.count("Patient denies chest pain") == 2
+
+
+def test_repeated_lines_in_page_bodies_are_kept():
+    body = "Day {}\nSeen on the ward round\nPatient denies chest pain\nBP 150/90 mmHg on arrival\nObs stable\nPlan unchanged\nReview tomorrow"
+    text = compact(document([body.format(i) for i in range(4)])).text
+    assert text.count("Patient denies chest pain") == 4
+    assert text.count("BP 150/90 mmHg on arrival") == 4
+
+
+def test_headers_footers_and_page_numbers_are_removed():
+    result = compact(document([f"Day {i}\nFever settling, afebrile overnight\nCRP {40 - i * 10} mg/L" for i in range(4)]))
+    assert result.text.count("St. Mary's Hospital") == 1
+    assert result.text.count("MRN 0012345") == 1
+    assert "CONFIDENTIAL NOTICE" not in result.text
+    assert "Page 2 of 4" not in result.text
+    assert result.text.count("afebrile overnight") == 4
+    assert result.text.count(PAGE_BREAK) == 3
+    assert result.tokens_after < result.tokens_before
+    assert result.lines_dropped == 14
+
+
+def test_page_furniture_is_removed_from_any_page():
+    text = compact("Page 1 of 2\nCough for three days\n-----\n" + PAGE_BREAK + "- 2 -\nChest clear").text
+    assert text == "Cough for three days\n" + PAGE_BREAK + "Chest clear"
+
+
+def test_serial_lab_rows_are_not_headers():
+    body = "Glucose 92 mg/dL (70-99)\nSodium 140 mmol/L (135-145)\nNo change"
+    text = compact(document([body] * 4)).text
+    assert text.count("Glucose 92 mg/dL (70-99)") == 4
+
+
+def test_whitespace_is_collapsed():
+    assert compact("Fever   and\tcough\n\n\n\nNo rash   \n\n").text == "Fever and cough\n\nNo rash"
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from src.knowledge import MonographIndex
+
+MONOGRAPHS = [
+    {"type": "medicine", "name": "Acetaminophen", "synonyms": ["paracetamol"], "brand_names": "Tylenol, Panadol",
+     "uses": ["Pain", "Fever"], "mechanism": "COX inhibition in the CNS", "dosage": "500-1000 mg q4-6h",
+     "lifestyle_diet": "Avoid alcohol", "side_effects": ["Rash"], "warnings": "Hepatotoxic in overdose"},
+    {"type": "medicine", "name": "Ibuprofen", "brand_names": "Advil", "dosage": "200-400 mg q6h"},
+    {"type": "test", "test_name": "Colonoscopy", "purpose": "Screening", "procedure": "Endoscopic exam",
+     "preparation": "Bowel prep the day before", "normal_range": "No polyps"},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    (tmp_path / "monographs.json").write_text(json.dumps(MONOGRAPHS), encoding="utf-8")
+    index = MonographIndex(str(tmp_path), refresh_seconds=3600)
+    yield index
+    index._snapshot.close()
+
+
+@pytest.mark.parametrize("query", [
+    "tylenol",
+    "what is paracetamol",
+    "tell me about Tylenol",
+    "acetaminophen side effects",
+    "uses of panadol",
+    "tylenol dosage",
+])
+def test_plain_name_queries_are_served(index, query):
+    assert index.lookup(query, "medicine")["dosage"] == "500-1000 mg q4-6h"
+
+
+@pytest.mark.parametrize("query", [
+    "tylenol dose for a 2 year old child",
+    "tylenol overdose antidote",
+    "is tylenol safe with liver cirrhosis",
+    "tylenol or ibuprofen for fever",
+    "tylenol and ibuprofen",
+    "can i take tylenol while pregnant",
+])
+def test_specific_questions_fall_through(index, query):
+    assert index.lookup(query, "medicine") is None
+
+
+def test_tests_are_looked_up_by_kind(index):
+    assert index.lookup("how to prepare for a colonoscopy", "test")["preparation"] == "Bowel prep the day before"
+    assert index.lookup("colonoscopy", "medicine") is None
+    assert index.lookup("colonoscopy after a stroke", "test") is None
+
+
+def test_changed_sources_are_reindexed(index, tmp_path):
+    assert index.lookup("ibuprofen", "medicine")["dosage"] == "200-400 mg q6h"
+    changed = MONOGRAPHS[:2] + [{"type": "medicine", "name": "Naproxen", "dosage": "250 mg q12h"}]
+    changed[1] = {**changed[1], "dosage": "400 mg q8h"}
+    (tmp_path / "monographs.json").write_text(json.dumps(changed), encoding="utf-8")
+    assert index.refresh(force=True)
+    assert index.lookup("ibuprofen", "medicine")["dosage"] == "400 mg q8h"
+    assert index.lookup("naproxen", "medicine")["dosage"] == "250 mg q12h"
+    assert index.stats()["records"] == 3
@@ -0,0 +1,98 @@
+import pytest
+
+from src.labs import LAB_LINE, parse_labs, table_data, lab_context
+
+
+def rows(text):
+    return {row["Analyte"]: row for row in table_data(parse_labs(text)[0])}
+
+
+@pytest.mark.parametrize("line, analyte, value, unit", [
+    ("Glucose 92 mg/dL 70-99", "Glucose", "92", "mg/dL"),
+    ("Hemoglobin: 13.5 g/dL [12.0 - 16.0]", "Hemoglobin", "13.5", "g/dL"),
+    ("WBC 11.2 H x10^9/L (4.0-11.0)", "WBC", "11.2", "x10^9/L"),
+    ("Troponin I <0.01 ng/mL (<0.04)", "Troponin I", "0.01", "ng/mL"),
+    ("eGFR >90 mL/min/1.73m2", "eGFR", "90", "mL/min/1.73m2"),
+])
+def test_lab_line_matches_common_layouts(line, analyte, value, unit):
+    match = LAB_LINE.match(line)
+    assert match
+    assert match["analyte"] == analyte
+    assert match["value"] == value
+    assert match["unit"] == unit
+
+
+def test_narrative_lines_are_not_labs():
+    text = "Patient seen on 12 March 2024\nGlucose 92 mg/dL 70-99\nFollow up in 2 weeks"
+    frame, narrative = parse_labs(text)
+    assert list(frame["analyte"]) == ["Glucose"]
+    assert narrative == "Patient seen on 12 March 2024\nFollow up in 2 weeks"
+
+
+def test_si_units_are_converted():
+    table = rows(
+        "Glucose 5.5 mmol/L\n"
+        "Creatinine 88.42 umol/L\n"
+        "Hemoglobin 95 g/L 120-160\n"
+    )
+    assert (table["Glucose"]["Value"], table["Glucose"]["Unit"]) == ("99.09", "mg/dL")
+    assert (table["Creatinine"]["Value"], table["Creatinine"]["Unit"]) == ("1", "mg/dL")
+    assert (table["Hemoglobin"]["Value"], table["Hemoglobin"]["Reference"]) == ("9.5", "12-16")
+
+
+def test_urea_and_urea_nitrogen_use_their_own_factors():
+    table = rows(
+        "Urea 5.0 mmol/L\n"
+        "Blood Urea Nitrogen 5.0 mmol/L\n"
+        "BUN 5.0 mmol/L\n"
+    )
+    assert table["Urea"]["Value"] == "30.03"
+    assert table["Blood Urea Nitrogen"]["Value"] == "14"
+    assert table["BUN"]["Value"] == "14"
+
+
+def test_flags_from_reference_ranges_and_printed_flags():
+    table = rows(
+        "Glucose 250 mg/dL 70-99\n"
+        "Sodium 128 mmol/L 135-145\n"
+        "Potassium 4.1 mmol/L 3.5-5.1\n"
+        "LDL 4.9 mmol/L (<3.0)\n"
+        "Ferritin 400 ng/mL H\n"
+    )
+    assert table["Glucose"]["Flag"] == "High"
+    assert table["Sodium"]["Flag"] == "Low"
+    assert table["Potassium"]["Flag"] == "Normal"
+    assert table["LDL"]["Flag"] == "High"
+    assert table["Ferritin"]["Flag"] == "High"
+
+
+def test_qualifier_is_kept_and_respected_by_flags():
+    text = (
+        "Troponin I <0.04 ng/mL (<0.04)\n"
+        "CRP >200 mg/L 0-5\n"
+        "eGFR >60 mL/min/1.73m2 (>60)\n"
+        "Vitamin B12 <150 pg/mL 200-900\n"
+        "CEA <2.5 ng/mL 0-5\n"
+    )
+    table = rows(text)
+    assert table["Troponin I"]["Value"] == "<0.04"
+    assert table["Troponin I"]["Flag"] == "Normal"
+    assert table["CRP"]["Value"] == ">200"
+    assert table["CRP"]["Flag"] == "High"
+    assert table["eGFR"]["Flag"] == "Normal"
+    assert table["Vitamin B12"]["Flag"] == "Low"
+    assert table["CEA"]["Flag"] == "Normal"
+
+    context = lab_context(parse_labs(text)[0])
+    assert "Troponin I (ng/mL, ref <0.04): <0.04" in context
+    assert "CRP (mg/L, ref 0-5): >200 H" in context
+
+
+def test_indeterminate_qualified_value_is_not_flagged():
+    table = rows("TSH <8 mIU/L 0.4-4.0\nVitamin D <40 ng/mL 30-100\nCRP >3 mg/L 0-5\n")
+    assert {analyte: row["Flag"] for analyte, row in table.items()} == {"TSH": "", "Vitamin D": "", "CRP": ""}
+
+
+def test_lab_context_groups_serial_values():
+    context = lab_context(parse_labs("Glucose 92 mg/dL 70-99\nGlucose 250 mg/dL 70-99\n")[0])
+    assert context == "Glucose (mg/dL, ref 70-99): 92, 250 H"
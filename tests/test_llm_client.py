@@ -0,0 +1,118 @@
+import asyncio
+import threading
+
+from src.llm_client import ResilientLLM
+
+
+class StreamingModel:
+    """Counts upstream calls; each stream waits on a gate so callers overlap."""
+
+    def __init__(self, chunks=("a", "b", "c")):
+        self.chunks = chunks
+        self.calls = 0
+        self.gate = threading.Event()
+        self.agate = None
+
+    def stream(self, payload, config=None, **kwargs):
+        self.calls += 1
+        self.gate.wait(5)
+        yield from self.chunks
+
+    async def astream(self, payload, config=None, **kwargs):
+        self.calls += 1
+        await self.agate.wait()
+        for chunk in self.chunks:
+            yield chunk
+
+
+def test_concurrent_identical_streams_share_one_backend_call():
+    model = StreamingModel()
+    llm = ResilientLLM(model)
+    results = [None, None]
+
+    def consume(i, payload):
+        results[i] = list(llm.stream(payload))
+
+    threads = [threading.Thread(target=consume, args=(i, "same prompt")) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    while not llm._streams or next(iter(llm._streams.values())).consumers < 2:
+        pass
+    model.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert model.calls == 1
+    assert results == [["a", "b", "c"], ["a", "b", "c"]]
+    assert llm._streams == {}
+    list(llm.stream("same prompt"))  # a later request is not served from the finished flight
+    assert model.calls == 2
+
+
+def test_concurrent_identical_async_streams_share_one_backend_call():
+    model = StreamingModel()
+    llm = ResilientLLM(model)
+
+    async def consume(payload):
+        return [chunk async for chunk in llm.astream(payload)]
+
+    async def main():
+        model.agate = asyncio.Event()
+        tasks = [asyncio.ensure_future(consume("same prompt")) for _ in range(2)]
+        other = asyncio.ensure_future(consume("another prompt"))
+        await asyncio.sleep(0.01)
+        model.agate.set()
+        return await asyncio.gather(*tasks, other)
+
+    assert asyncio.run(main()) == [["a", "b", "c"]] * 3
+    assert model.calls == 2
+    assert llm._streams == {}
+
+
+def test_a_cancelled_async_caller_does_not_cut_off_the_others():
+    model = StreamingModel()
+    llm = ResilientLLM(model)
+
+    async def consume():
+        return [chunk async for chunk in llm.astream("same prompt")]
+
+    async def main():
+        model.agate = asyncio.Event()
+        dropped, kept = asyncio.ensure_future(consume()), asyncio.ensure_future(consume())
+        await asyncio.sleep(0.01)
+        dropped.cancel()
+        await asyncio.sleep(0)
+        model.agate.set()
+        return await kept
+
+    assert asyncio.run(main()) == ["a", "b", "c"]
+    assert model.calls == 1
+
+
+def test_stream_errors_reach_every_caller():
+    class Failing(StreamingModel):
+        def stream(self, payload, config=None, **kwargs):
+            self.calls += 1
+            self.gate.wait(5)
+            yield "a"
+            raise ValueError("boom")
+
+    model = Failing()
+    llm = ResilientLLM(model, max_retries=0)
+    errors = []
+
+    def consume():
+        try:
+            list(llm.stream("same prompt"))
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=consume) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while not llm._streams or next(iter(llm._streams.values())).consumers < 2:
+        pass
+    model.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 2 and model.calls == 1
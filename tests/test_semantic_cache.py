@@ -0,0 +1,108 @@
+import time
+import types
+
+import pytest
+
+from src import semantic_cache
+from src.semantic_cache import SemanticCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(semantic_cache, "time", types.SimpleNamespace(time=clock.time, perf_counter=time.perf_counter))
+    return clock
+
+
+@pytest.fixture
+def cache(clock):
+    return SemanticCache(ttl_seconds=3600)
+
+
+def answer(cache, intent, text, cached):
+    cache.add("ns", intent, cached, {"cached": cached})
+    match = cache.lookup("ns", intent, text)
+    return match and match[0]["cached"]
+
+
+@pytest.mark.parametrize("intent, cached, query", [
+    ("medicine_info", "metformin dosage", "What is the dosage of metformin?"),
+    ("medicine_info", "tell me about warfarin", "warfarin"),
+    ("medicine_info", "what is lisinopril used for", "Lisinopril: common uses"),
+    ("test_info", "how to prepare for a colonoscopy", "Colonoscopy preparation"),
+    ("diagnosis", "Fever and cough for 3 days, no rash", "fever and cough for 3 days,   NO RASH."),
+])
+def test_paraphrases_hit(cache, intent, cached, query):
+    assert answer(cache, intent, query, cached) == cached
+
+
+@pytest.mark.parametrize("intent, cached, query", [
+    ("medicine_info", "metformin dose in kidney failure", "metformin dose in liver failure"),
+    ("medicine_info", "warfarin interactions with aspirin", "insulin interactions with aspirin"),
+    ("medicine_info", "metformin dosage in kidney failure", "metformin dosage"),
+    ("medicine_info", "metformin dosage", "metformin dosage in pregnancy"),
+    ("test_info", "liver function test preparation", "kidney function test preparation"),
+    # Long enough that one swapped word still scores above the 0.9 similarity threshold.
+    ("medicine_info",
+     "starting dose of metformin extended release for elderly patients with chronic kidney disease and obesity",
+     "starting dose of metformin extended release for elderly patients with chronic liver disease and obesity"),
+    ("medicine_info",
+     "warfarin interactions with aspirin clopidogrel ibuprofen naproxen heparin amiodarone fluconazole rifampicin",
+     "insulin interactions with aspirin clopidogrel ibuprofen naproxen heparin amiodarone fluconazole rifampicin"),
+])
+def test_substitutions_and_extra_terms_miss(cache, intent, cached, query):
+    assert answer(cache, intent, query, cached) is None
+
+
+def test_word_order_matters_for_diagnosis(cache):
+    cached = "Patient with numbness in the left arm and weakness in the right leg since this morning"
+    swapped = "Patient with numbness in the right arm and weakness in the left leg since this morning"
+    assert answer(cache, "diagnosis", swapped, cached) is None
+    assert cache.lookup("ns", "diagnosis", cached)
+
+
+def test_diagnosis_keeps_filler_words(cache):
+    assert answer(cache, "diagnosis", "chest pain, used cocaine", "chest pain") is None
+
+
+@pytest.mark.parametrize("cached, query", [
+    ("Fever for 3 days with cough", "Fever for 5 days with cough"),
+    ("Chest pain radiating to the jaw", "No chest pain radiating to the jaw"),
+    ("metformin 500 mg dosage", "metformin 1000 mg dosage"),
+])
+def test_numbers_and_negations_must_match(cache, cached, query):
+    intent = "medicine_info" if "metformin" in cached else "diagnosis"
+    assert answer(cache, intent, query, cached) is None
+
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.add("ns", "medicine_info", "metformin dosage", {"a": 1})
+    clock.now += 3599
+    assert cache.lookup("ns", "medicine_info", "metformin dosage")
+    clock.now += 2
+    assert cache.lookup("ns", "medicine_info", "metformin dosage") is None
+
+
+def test_ring_overwrites_the_oldest_entry(clock):
+    cache = SemanticCache(max_entries=3)
+    names = ["metformin", "warfarin", "insulin", "lisinopril"]
+    for name in names:
+        cache.add("ns", "medicine_info", f"{name} dosage", {"name": name})
+    assert cache.lookup("ns", "medicine_info", "metformin dosage") is None
+    for name in names[1:]:
+        assert cache.lookup("ns", "medicine_info", f"{name} dosage")[0] == {"name": name}
+    assert cache.stats()["entries"] == 3
+
+
+def test_namespaces_and_unknown_intents_are_separate(cache):
+    cache.add("ns", "medicine_info", "metformin dosage", {"a": 1})
+    assert cache.lookup("other", "medicine_info", "metformin dosage") is None
+    assert cache.lookup("ns", "chat", "metformin dosage") is None
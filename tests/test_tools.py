@@ -0,0 +1,40 @@
+import io
+
+import PyPDF2
+from PIL import Image
+
+from src.tools import FileTools
+
+
+def pdf(*pages):
+    """pages: "blank" for a page with neither text nor images, or a PIL image for a scanned page."""
+    writer = PyPDF2.PdfWriter()
+    for page in pages:
+        if page == "blank":
+            writer.add_blank_page(612, 792)
+            continue
+        buffer = io.BytesIO()
+        page.save(buffer, "PDF", resolution=150)
+        writer.add_page(PyPDF2.PdfReader(buffer).pages[0])
+    out = io.BytesIO()
+    writer.write(out)
+    out.seek(0)
+    return out
+
+
+def scan():
+    return Image.new("L", (400, 600), 200)
+
+
+def test_scanned_pages_without_a_readable_image_are_reported():
+    content = FileTools.extract_pdf(pdf(scan(), "blank", scan()), workers=1)
+    assert content.error is None
+    assert content.scanned_pages == [1, 2, 3]
+    assert len(content.page_images) == 2
+    assert content.unread_pages == (2,)
+
+
+def test_a_pdf_with_only_unreadable_pages_is_an_error_that_lists_them():
+    content = FileTools.extract_pdf(pdf("blank", "blank"), workers=1)
+    assert content.error
+    assert content.unread_pages == (1, 2)